@@ -0,0 +1,48 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from rest_framework.permissions import SAFE_METHODS
+
+ASYNC_READ_ROUTES = (
+    'recipes-list', 'recipes-detail',
+    'ingredients-list', 'ingredients-detail',
+    'tags-list', 'tags-detail',
+)
+
+
+def run_view(view, request, *args, **kwargs):
+    """Выполняет представление и рендерит ответ в текущем потоке."""
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if callable(getattr(response, 'render', None)):
+            response = response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    """
+    Асинхронная обёртка над представлением DRF для запуска под ASGI.
+    Чтение выполняется в общем пуле потоков (thread_sensitive=False), так
+    что соединения не ждут друг друга в одном потоке, а запись, как и у
+    синхронных представлений, идёт в основном потоке.
+    """
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await sync_to_async(
+            run_view, thread_sensitive=request.method not in SAFE_METHODS
+        )(view, request, *args, **kwargs)
+
+    return wrapper
+
+
+def async_read_urls(patterns, names=ASYNC_READ_ROUTES):
+    """Заменяет представления маршрутов из names асинхронными."""
+    for pattern in patterns:
+        if pattern.name in names:
+            pattern.callback = async_view(pattern.callback)
+    return patterns
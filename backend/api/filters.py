@@ -1,20 +1,29 @@
+from django.db import connection
+from django.db.models import (Case, Exists, IntegerField, OuterRef, Q, Value,
+                              When)
+from django.utils.functional import cached_property
 from django_filters.rest_framework import FilterSet, filters
-from rest_framework.filters import SearchFilter
-from recipes.models import Recipe, Tag
+from rest_framework.filters import BaseFilterBackend
+from recipes import search
+from recipes.cache import tag_ids_by_slug
+from recipes.models import (FavoriteReceipe, Recipe, ShoppingCart,
+                            normalize_search_name)
 
 
 class RecipeFilter(FilterSet):
-    """Класс для фильтрации обьектов Recipes."""
+    """
+    Класс для фильтрации обьектов Recipes.
+    Теги, избранное и список покупок проверяются подзапросами EXISTS,
+    поэтому рецепт с несколькими подходящими тегами не дублируется
+    и DISTINCT не нужен.
+    """
 
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
-    )
+    tags = filters.MultipleChoiceFilter(method='tags_filter')
     is_favorited = filters.BooleanFilter(method='is_favorited_filter')
     is_in_shopping_cart = filters.BooleanFilter(
         method='is_in_shopping_cart_filter'
     )
+    search = filters.CharFilter(method='search_filter')
 
     class Meta:
         model = Recipe
@@ -23,22 +32,104 @@ class RecipeFilter(FilterSet):
             'author',
             'is_favorited',
             'is_in_shopping_cart',
+            'search',
         )
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Функция, а не связанный метод: поля формы копируются deepcopy.
+        def tag_choices():
+            return [(slug, slug) for slug in self.tag_ids]
+
+        self.filters['tags'].extra['choices'] = tag_choices
+
+    @cached_property
+    def tag_ids(self):
+        """
+        Один снимок тегов на запрос: по нему и проверяются слаги,
+        и строится фильтр, даже если версия тегов сменится между ними.
+        """
+        return tag_ids_by_slug()
+
+    def tags_filter(self, queryset, name, data):
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'),
+                tag_id__in=[self.tag_ids[slug] for slug in data],
+            )
+        ))
+
     def is_favorited_filter(self, queryset, name, data):
         user = self.request.user
         if data and user.is_authenticated:
-            return queryset.filter(favorite_recipes__user=user)
+            return queryset.filter(Exists(
+                FavoriteReceipe.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                )
+            ))
         return queryset
 
     def is_in_shopping_cart_filter(self, queryset, name, data):
         user = self.request.user
         if data and user.is_authenticated:
-            return queryset.filter(shopping_recipes__user=user)
+            return queryset.filter(Exists(
+                ShoppingCart.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                )
+            ))
         return queryset
 
+    def search_filter(self, queryset, name, data):
+        """
+        Полнотекстовый поиск по названию, ингредиентам и описанию.
+        Без поиска в базе рецепты ранжирует RecipeViewSet.search_list.
+        """
+        if not data.strip() or not search.uses_database_ranking():
+            return queryset
+        return search.search_recipes(queryset, data)
+
 
-class IngredientFilter(SearchFilter):
-    """Класс для фильтрации обьектов Tags."""
+class IngredientFilter(BaseFilterBackend):
+    """
+    Поиск ингредиентов по названию без учёта регистра и диакритики.
+    Совпадение по началу названия ищется по индексу search_name;
+    вхождение в середину названия — только в PostgreSQL по триграммному
+    индексу, для запросов от трёх символов. Точное совпадение и
+    совпадение по началу названия выводятся выше остальных.
+    """
 
     search_param = 'name'
+    trigram_min_length = 3
+
+    def prefix_filter(self, search_name):
+        if connection.vendor == 'postgresql':
+            # LIKE 'x%' идёт по индексу с varchar_pattern_ops.
+            return Q(search_name__startswith=search_name)
+        # SQLite не использует индекс для LIKE с ESCAPE, а диапазон
+        # по бинарному сравнению строк — использует.
+        return Q(
+            search_name__gte=search_name,
+            search_name__lt=search_name + chr(0x10FFFF),
+        )
+
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get(self.search_param, '')
+        search_name = normalize_search_name(name.strip())
+        if not search_name:
+            return queryset
+        if (
+            connection.vendor == 'postgresql'
+            and len(search_name) >= self.trigram_min_length
+        ):
+            condition = Q(search_name__contains=search_name)
+        else:
+            condition = self.prefix_filter(search_name)
+        return queryset.filter(condition).annotate(
+            search_rank=Case(
+                When(search_name=search_name, then=Value(0)),
+                When(search_name__startswith=search_name, then=Value(1)),
+                default=Value(2),
+                output_field=IntegerField(),
+            )
+        ).order_by('search_rank', 'search_name')
@@ -0,0 +1,207 @@
+import json
+import random
+import statistics
+import subprocess
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.middleware import QueryCollector
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга."""
+    values = sorted(values)
+    index = max(0, round(percent / 100 * len(values) + 0.5) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку (p50/p95) и число SQL-запросов основных '
+        'эндпоинтов API на текущей базе и сохраняет результат в JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--user', help='Email пользователя, от имени которого идут '
+                           'запросы. По умолчанию пользователь с наибольшим '
+                           'числом подписок.',
+        )
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios',
+            help='Запустить только указанные сценарии.',
+        )
+        parser.add_argument(
+            '--seed', type=int,
+            help='Зерно для выбора ингредиента поиска. По умолчанию '
+                 'берётся ингредиент с наименьшим id.',
+        )
+        parser.add_argument('--output', help='Файл для результатов.')
+        parser.add_argument(
+            '--compare', help='JSON с предыдущими результатами для сравнения.'
+        )
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        scenarios = self.get_scenarios(user, options['seed'])
+        if options['scenarios']:
+            unknown = set(options['scenarios']) - scenarios.keys()
+            if unknown:
+                raise CommandError(f'Неизвестные сценарии: {unknown}')
+            scenarios = {
+                name: path for name, path in scenarios.items()
+                if name in options['scenarios']
+            }
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(
+            SERVER_NAME='localhost',
+            HTTP_AUTHORIZATION=f'Token {token.key}',
+        )
+
+        results = {}
+        for name, path in scenarios.items():
+            results[name] = self.run_scenario(
+                client, path, options['iterations'], options['warmup']
+            )
+            self.stdout.write(
+                '{:<28} p50 {p50_ms:8.2f} мс  p95 {p95_ms:8.2f} мс  '
+                'запросов {queries}'.format(name, **results[name])
+            )
+
+        report = {
+            'revision': git_revision(),
+            'created': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'dataset': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'ingredients': Ingredient.objects.count(),
+            },
+            'iterations': options['iterations'],
+            'seed': options['seed'],
+            'results': results,
+        }
+        if options['compare']:
+            self.compare(options['compare'], results)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+
+    def get_user(self, email):
+        if email:
+            user = User.objects.filter(email=email).first()
+        else:
+            user = User.objects.annotate(
+                follows=Count('follower')
+            ).order_by('-follows').first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователей. Сначала выполните seed_dataset.'
+            )
+        return user
+
+    def get_ingredient(self, seed):
+        """
+        Ингредиент для сценария поиска: одинаковый от запуска к запуску,
+        чтобы результаты можно было сравнивать.
+        """
+        ingredients = Ingredient.objects.order_by('id')
+        if seed is None:
+            return ingredients.first()
+        count = ingredients.count()
+        if not count:
+            return None
+        return ingredients[random.Random(seed).randrange(count)]
+
+    def get_scenarios(self, user, seed=None):
+        recipe = Recipe.objects.order_by('-pub_date', '-id').first()
+        tag = Tag.objects.order_by('id').first()
+        ingredient = self.get_ingredient(seed)
+        if recipe is None or tag is None or ingredient is None:
+            raise CommandError(
+                'Нет рецептов, тегов или ингредиентов. '
+                'Сначала выполните seed_dataset.'
+            )
+        return {
+            'recipes_list': '/api/recipes/?limit=6',
+            'recipes_list_tags': f'/api/recipes/?limit=6&tags={tag.slug}',
+            'recipes_list_author': (
+                f'/api/recipes/?limit=6&author={recipe.author_id}'
+            ),
+            'recipes_list_favorited': '/api/recipes/?limit=6&is_favorited=1',
+            'recipes_list_in_cart': (
+                '/api/recipes/?limit=6&is_in_shopping_cart=1'
+            ),
+            'recipes_list_deep_page': '/api/recipes/?limit=6&page=50',
+            'recipes_list_cursor': '/api/recipes/?limit=6&pagination=cursor',
+            'recipe_detail': f'/api/recipes/{recipe.id}/',
+            'subscriptions': (
+                '/api/users/subscriptions/?limit=6&recipes_limit=3'
+            ),
+            'feed': '/api/recipes/feed/?limit=6',
+            'ingredient_search': (
+                f'/api/ingredients/?name={ingredient.name[:3]}'
+            ),
+            'download_shopping_cart': '/api/recipes/download_shopping_cart/',
+        }
+
+    def run_scenario(self, client, path, iterations, warmup):
+        collector = QueryCollector()
+        with connection.execute_wrapper(collector):
+            response = self.request(client, path)
+        for _ in range(warmup):
+            self.request(client, path)
+        durations = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            self.request(client, path)
+            durations.append((time.perf_counter() - started) * 1000)
+        return {
+            'path': path,
+            'status': response.status_code,
+            'queries': collector.count,
+            'p50_ms': round(percentile(durations, 50), 3),
+            'p95_ms': round(percentile(durations, 95), 3),
+            'mean_ms': round(statistics.mean(durations), 3),
+        }
+
+    def request(self, client, path):
+        response = client.get(path)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)['results']
+        self.stdout.write(f'\nСравнение с {path}:')
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            before = baseline[name]
+            change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms']
+            self.stdout.write(
+                f'{name:<28} p50 {before["p50_ms"]:8.2f} → '
+                f'{result["p50_ms"]:8.2f} мс ({change:+.0%}), запросов '
+                f'{before["queries"]} → {result["queries"]}'
+            )
@@ -0,0 +1,91 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F
+
+from recipes.matching import IngredientIndex
+from recipes.models import Ingredient, IngredientInRecipesAmount
+
+from .benchmark_api import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет подбор рецептов по имеющимся ингредиентам: индекс в '
+        'памяти на синтетических данных разного размера и запрос с '
+        'группировкой в базе на текущих данных.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, nargs='+',
+            default=[1000, 10000, 100000, 1000000],
+        )
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--per-recipe', type=int, default=8)
+        parser.add_argument(
+            '--pantry', type=int, default=8,
+            help='Сколько ингредиентов есть у пользователя.',
+        )
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        for count in options['recipes']:
+            rows = sorted(
+                (ingredient_id, recipe_id)
+                for recipe_id in range(1, count + 1)
+                for ingredient_id in rng.sample(
+                    range(1, options['ingredients'] + 1),
+                    options['per_recipe'],
+                )
+            )
+            started = time.perf_counter()
+            index = IngredientIndex(rows)
+            build = (time.perf_counter() - started) * 1000
+            durations = self.measure(
+                lambda pantry: index.match(pantry),
+                range(1, options['ingredients'] + 1), rng, options,
+            )
+            self.stdout.write(
+                f'индекс, рецептов {count:>8}: построение {build:9.1f} мс, '
+                f'p50 {percentile(durations, 50):8.3f} мс, '
+                f'p95 {percentile(durations, 95):8.3f} мс'
+            )
+
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if not ingredient_ids:
+            return
+        recipes = IngredientInRecipesAmount.objects.values(
+            'recipe_id'
+        ).distinct().count()
+        durations = self.measure(
+            self.match_in_db, ingredient_ids, rng, options
+        )
+        self.stdout.write(
+            f'база,   рецептов {recipes:>8}: '
+            f'p50 {percentile(durations, 50):8.3f} мс, '
+            f'p95 {percentile(durations, 95):8.3f} мс'
+        )
+
+    def measure(self, match, ingredient_ids, rng, options):
+        durations = []
+        for _ in range(options['iterations']):
+            pantry = rng.sample(ingredient_ids, options['pantry'])
+            started = time.perf_counter()
+            match(pantry)
+            durations.append((time.perf_counter() - started) * 1000)
+        return durations
+
+    def match_in_db(self, pantry):
+        """Тот же подбор одним запросом с JOIN и GROUP BY."""
+        return list(IngredientInRecipesAmount.objects.filter(
+            recipe__recipe__ingredient_id__in=pantry
+        ).values('recipe_id').annotate(
+            matched=Count('recipe__recipe', distinct=True),
+            total=Count('id', distinct=True),
+        ).annotate(missing=F('total') - F('matched')).order_by(
+            'missing', '-matched', '-recipe_id'
+        ))
@@ -0,0 +1,58 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+
+from .benchmark_api import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает задержку запроса к API с новым соединением с базой на '
+        'каждый запрос (CONN_MAX_AGE=0) и с постоянным соединением.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=100)
+        parser.add_argument('--path', default='/api/recipes/?limit=6')
+
+    def handle(self, *args, **options):
+        client = Client(SERVER_NAME='localhost')
+        database = settings.DATABASES['default']
+        self.stdout.write(
+            f'{connection.vendor}, CONN_MAX_AGE={database["CONN_MAX_AGE"]}, '
+            'DISABLE_SERVER_SIDE_CURSORS='
+            f'{database["DISABLE_SERVER_SIDE_CURSORS"]}'
+        )
+        client.get(options['path'])
+        results = {}
+        for name, reconnect in (('new', True), ('persistent', False)):
+            results[name] = self.measure(
+                client, options['path'], options['iterations'], reconnect
+            )
+            self.stdout.write(
+                '{:<11} p50 {:8.3f} мс  p95 {:8.3f} мс  среднее {:8.3f} мс'
+                .format(name, *results[name])
+            )
+        saved = results['new'][2] - results['persistent'][2]
+        self.stdout.write(
+            f'Экономия на запрос: {saved:.3f} мс '
+            f'({saved / results["new"][2]:.0%})'
+        )
+
+    def measure(self, client, path, iterations, reconnect):
+        durations = []
+        for _ in range(iterations):
+            if reconnect:
+                connection.close()
+            started = time.perf_counter()
+            client.get(path)
+            durations.append((time.perf_counter() - started) * 1000)
+        return (
+            percentile(durations, 50),
+            percentile(durations, 95),
+            statistics.mean(durations),
+        )
@@ -0,0 +1,221 @@
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from users.models import User
+
+from .benchmark_api import git_revision, percentile
+
+SERVERS = {
+    'sync': {
+        'app': 'foodgram.wsgi:application',
+        'worker_class': 'sync',
+        'env': {'ASYNC_READ_VIEWS': 'False'},
+    },
+    'async': {
+        'app': 'foodgram.asgi:application',
+        'worker_class': 'uvicorn.workers.UvicornWorker',
+        'env': {'ASYNC_READ_VIEWS': 'True'},
+    },
+}
+
+
+def process_rss(pid):
+    """Резидентная память процесса в КиБ (Linux, /proc)."""
+    try:
+        with open(f'/proc/{pid}/status', encoding='utf-8') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def child_pids(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', encoding='utf-8') as file:
+                stat = file.read()
+        except OSError:
+            continue
+        if int(stat.rsplit(')', 1)[1].split()[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+def workers_rss(pid):
+    return sum(process_rss(child) for child in child_pids(pid))
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает gunicorn с синхронными воркерами и gunicorn с воркерами '
+        'uvicorn (ASGI, асинхронные представления) при одинаковом числе '
+        'воркеров: пропускная способность, задержка и память на соединение.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument(
+            '--concurrency', type=int, nargs='+', default=[1, 8, 32, 64],
+        )
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Число запросов на каждый уровень параллельности.',
+        )
+        parser.add_argument('--path', default='/api/recipes/?limit=6')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument(
+            '--server', action='append', dest='servers',
+            choices=SERVERS.keys(),
+            help='Запустить только указанный вариант сервера.',
+        )
+        parser.add_argument('--user', help='Email пользователя.')
+        parser.add_argument('--output', help='Файл для результатов.')
+
+    def handle(self, *args, **options):
+        headers = {}
+        user = self.get_user(options['user'])
+        if user is not None:
+            token, _ = Token.objects.get_or_create(user=user)
+            headers['Authorization'] = f'Token {token.key}'
+
+        results = {}
+        for name in options['servers'] or SERVERS:
+            results[name] = self.run_server(name, headers, options)
+
+        if options['output']:
+            report = {
+                'revision': git_revision(),
+                'created': timezone.now().isoformat(),
+                'path': options['path'],
+                'workers': options['workers'],
+                'results': results,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+
+    def get_user(self, email):
+        if email:
+            user = User.objects.filter(email=email).first()
+            if user is None:
+                raise CommandError(f'Пользователь {email} не найден.')
+            return user
+        return User.objects.annotate(
+            follows=Count('follower')
+        ).order_by('-follows').first()
+
+    def run_server(self, name, headers, options):
+        server = SERVERS[name]
+        env = {**os.environ, **server['env']}
+        process = subprocess.Popen(
+            [
+                sys.executable, '-m', 'gunicorn', server['app'],
+                '--worker-class', server['worker_class'],
+                '--workers', str(options['workers']),
+                '--bind', f'127.0.0.1:{options["port"]}',
+                '--log-level', 'warning',
+            ],
+            env=env,
+        )
+        try:
+            self.wait_ready(process, options['port'])
+            # Прогрев: каждый воркер загружает приложение и открывает
+            # соединение с базой.
+            for _ in range(options['workers'] * 5):
+                self.request(options['port'], options['path'], headers)
+            idle_rss = workers_rss(process.pid)
+            levels = []
+            for concurrency in options['concurrency']:
+                levels.append(self.run_level(
+                    process.pid, options['port'], options['path'], headers,
+                    concurrency, options['requests'], idle_rss,
+                ))
+                self.stdout.write(
+                    '{server:<6} c={concurrency:<4} {rps:8.1f} rps  '
+                    'p50 {p50_ms:8.2f} мс  p95 {p95_ms:8.2f} мс  '
+                    'ошибок {errors}  память {rss_per_connection_kb:7.1f} '
+                    'КиБ/соединение'.format(server=name, **levels[-1])
+                )
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+        return {'idle_rss_kb': idle_rss, 'levels': levels}
+
+    def wait_ready(self, process, port, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError('Сервер завершился при запуске.')
+            try:
+                socket.create_connection(('127.0.0.1', port), 1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError('Сервер не запустился за отведённое время.')
+
+    def request(self, port, path, headers):
+        started = time.perf_counter()
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            ok = response.status == 200
+        except OSError:
+            ok = False
+        finally:
+            connection.close()
+        return (time.perf_counter() - started) * 1000, ok
+
+    def run_level(self, pid, port, path, headers, concurrency, requests,
+                  idle_rss):
+        peak_rss = idle_rss
+        sampling = threading.Event()
+
+        def sample():
+            nonlocal peak_rss
+            while not sampling.is_set():
+                peak_rss = max(peak_rss, workers_rss(pid))
+                time.sleep(0.05)
+
+        sampler = threading.Thread(target=sample)
+        sampler.start()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(
+                lambda _: self.request(port, path, headers), range(requests)
+            ))
+        elapsed = time.perf_counter() - started
+        sampling.set()
+        sampler.join()
+
+        durations = [duration for duration, _ in results]
+        return {
+            'concurrency': concurrency,
+            'rps': round(requests / elapsed, 1),
+            'p50_ms': round(percentile(durations, 50), 3),
+            'p95_ms': round(percentile(durations, 95), 3),
+            'mean_ms': round(statistics.mean(durations), 3),
+            'errors': sum(not ok for _, ok in results),
+            'peak_rss_kb': peak_rss,
+            'rss_per_connection_kb': round(
+                (peak_rss - idle_rss) / concurrency, 1
+            ),
+        }
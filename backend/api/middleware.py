@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('foodgram.performance')
+
+
+class RequestStats:
+    """Накопленная в памяти процесса статистика по представлениям."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = defaultdict(Counter)
+
+    def add(self, view, total, db, queries):
+        with self.lock:
+            stats = self.views[view]
+            stats['requests'] += 1
+            stats['total_ms'] += total
+            stats['db_ms'] += db
+            stats['queries'] += queries
+            stats['max_ms'] = max(stats['max_ms'], total)
+            stats['max_queries'] = max(stats['max_queries'], queries)
+
+    def report(self):
+        with self.lock:
+            views = {view: dict(stats) for view, stats in self.views.items()}
+        report = []
+        for view, stats in views.items():
+            requests = stats['requests']
+            report.append({
+                'view': view,
+                'requests': requests,
+                'avg_ms': round(stats['total_ms'] / requests, 2),
+                'max_ms': round(stats['max_ms'], 2),
+                'avg_db_ms': round(stats['db_ms'] / requests, 2),
+                'avg_queries': round(stats['queries'] / requests, 2),
+                'max_queries': stats['max_queries'],
+            })
+        return sorted(report, key=lambda view: view['avg_ms'], reverse=True)
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+
+
+request_stats = RequestStats()
+
+
+class QueryCollector:
+    """Обёртка над выполнением SQL, считающая запросы и их время."""
+
+    def __init__(self):
+        self.statements = Counter()
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.statements[sql] += 1
+
+    @property
+    def count(self):
+        return sum(self.statements.values())
+
+    def duplicates(self, limit=3):
+        return [
+            (count, sql) for sql, count in self.statements.most_common(limit)
+            if count > 1
+        ]
+
+
+active_collector = ContextVar('active_collector', default=None)
+
+
+def collect_queries(execute, sql, params, many, context):
+    """
+    Передаёт SQL сборщику текущего запроса. Сборщик хранится в контекстной
+    переменной, поэтому учитываются и запросы из потоков sync_to_async.
+    """
+    collector = active_collector.get()
+    if collector is None:
+        return execute(sql, params, many, context)
+    return collector(execute, sql, params, many, context)
+
+
+def install_collector(sender=None, connection=None, **kwargs):
+    if collect_queries not in connection.execute_wrappers:
+        # В начало списка: execute_wrapper() снимает обёртки с конца.
+        connection.execute_wrappers.insert(0, collect_queries)
+
+
+connection_created.connect(install_collector)
+
+
+class QueryTimingMiddleware:
+    """
+    Замеряет число SQL-запросов, время в базе, время рендеринга ответа и
+    общее время запроса. Значения отдаются в заголовке Server-Timing,
+    медленные запросы пишутся в лог вместе с повторяющимся SQL.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        install_collector(connection=connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            active_collector.reset(token)
+        return self.finish(request, response, started)
+
+    async def __acall__(self, request):
+        started, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            active_collector.reset(token)
+        return self.finish(request, response, started)
+
+    def start(self, request):
+        request.query_collector = QueryCollector()
+        request.render_duration = 0.0
+        return time.perf_counter(), active_collector.set(
+            request.query_collector
+        )
+
+    def finish(self, request, response, started):
+        collector = request.query_collector
+        total = (time.perf_counter() - started) * 1000
+        db = collector.duration * 1000
+        render = request.render_duration * 1000
+        app = max(total - db - render, 0)
+        response['Server-Timing'] = (
+            f'db;dur={db:.1f};desc="{collector.count} queries", '
+            f'render;dur={render:.1f}, app;dur={app:.1f}, '
+            f'total;dur={total:.1f}'
+        )
+        match = request.resolver_match
+        view = f'{request.method} {match.view_name if match else None}'
+        request_stats.add(view, total, db, collector.count)
+        if total > settings.SLOW_REQUEST_THRESHOLD_MS:
+            logger.warning(
+                'Медленный запрос %s (%s): %.1f мс, SQL: %s запросов '
+                'за %.1f мс. Повторяющиеся запросы: %s',
+                request.path, view, total, collector.count,
+                db, collector.duplicates(),
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        started = time.perf_counter()
+
+        def finish_render(response):
+            request.render_duration = time.perf_counter() - started
+
+        response.add_post_render_callback(finish_render)
+        return response
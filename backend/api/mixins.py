@@ -0,0 +1,52 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipes.cache import version_info
+
+
+class CachedReferenceMixin:
+    """
+    Кэширование ответов справочников (теги, ингредиенты).
+    Ответ хранится в кэше под версией модели из базы, которая меняется
+    сигналами при сохранении и удалении объектов, в любом процессе.
+    Клиент с актуальными ETag или If-Modified-Since получает 304.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        model = self.get_queryset().model
+        version, updated_at = version_info(model)
+        path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        key = f'reference:{model._meta.label_lower}:{version}:{path_hash}'
+        data = cache.get(key)
+        if data is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, settings.REFERENCE_CACHE_TIMEOUT)
+        response = Response(data)
+        response['ETag'] = quote_etag(f'{version}-{path_hash}')
+        last_modified = None
+        if updated_at is not None:
+            last_modified = int(updated_at.timestamp())
+            response['Last-Modified'] = http_date(last_modified)
+        return get_conditional_response(
+            request,
+            etag=response['ETag'],
+            last_modified=last_modified,
+            response=response,
+        )
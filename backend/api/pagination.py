@@ -1,6 +1,23 @@
-from rest_framework.pagination import PageNumberPagination
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class LimitPaginator(PageNumberPagination):
     """Класс пагинации страниц."""
     page_size_query_param = 'limit'
+
+
+class RecipeCursorPaginator(CursorPagination):
+    """
+    Курсорная пагинация ленты рецептов для бесконечной прокрутки.
+    Страница выбирается по ключу (pub_date, id) без OFFSET и COUNT(*).
+    """
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
+
+
+class RecipeMatchPaginator(LimitPaginator):
+    """Пагинация подбора рецептов: без ?limit отдаётся первая страница."""
+    page_size = 6
+    max_page_size = settings.MAX_PAGE_SIZE
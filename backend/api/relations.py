@@ -0,0 +1,40 @@
+from django.utils.functional import cached_property
+
+from recipes.models import FavoriteReceipe, ShoppingCart
+from users.models import Follow
+
+
+class UserRelations:
+    """
+    Избранное, список покупок и подписки текущего пользователя.
+    Каждый набор id загружается одним запросом на весь запрос к API.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    def load(self, model, field):
+        if not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(model.objects.filter(
+            user=self.user
+        ).values_list(field, flat=True))
+
+    @cached_property
+    def favorite_ids(self):
+        return self.load(FavoriteReceipe, 'recipe_id')
+
+    @cached_property
+    def cart_ids(self):
+        return self.load(ShoppingCart, 'recipe_id')
+
+    @cached_property
+    def following_ids(self):
+        return self.load(Follow, 'author_id')
+
+
+def get_relations(request):
+    """Связи пользователя, общие для всех сериализаторов запроса."""
+    if not hasattr(request, 'user_relations'):
+        request.user_relations = UserRelations(request.user)
+    return request.user_relations
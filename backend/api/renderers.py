@@ -0,0 +1,37 @@
+from rest_framework.renderers import BaseRenderer
+
+
+class ShoppingCartRenderer(BaseRenderer):
+    """
+    Базовый рендерер выгрузки списка покупок.
+    Сам список отдаётся потоком из представления, рендерер нужен для
+    выбора формата через ?format= и отрисовки сообщений об ошибках.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return str(data).encode(self.charset)
+
+
+class ShoppingCartTxtRenderer(ShoppingCartRenderer):
+    """Список покупок в текстовом формате."""
+
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class ShoppingCartCsvRenderer(ShoppingCartRenderer):
+    """Список покупок в формате CSV."""
+
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class ShoppingCartPdfRenderer(ShoppingCartRenderer):
+    """Список покупок в формате PDF."""
+
+    media_type = 'application/pdf'
+    format = 'pdf'
@@ -1,14 +1,20 @@
-import base64
-
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
 from rest_framework.serializers import (ImageField, ModelSerializer, CharField,
-                                        PrimaryKeyRelatedField, ReadOnlyField,
-                                        SerializerMethodField, ValidationError)
+                                        IntegerField, PrimaryKeyRelatedField,
+                                        ReadOnlyField, SerializerMethodField,
+                                        ValidationError)
 
 from foodgram.settings import ZERO_MIN_VALUE
+from recipes import feed, matching, search, shopping_list
+from recipes.images import (check_image_pixels, decode_base64,
+                            schedule_thumbnail)
 from recipes.models import Ingredient, IngredientInRecipesAmount, Recipe, Tag
 from users.models import Follow, User
 
+from .relations import get_relations
+
 
 class IngredientSerializer(ModelSerializer):
     """Сериализатор объектов типа Ingredients. Список ингредиентов."""
@@ -37,13 +43,23 @@ class IngredientsInRecipeReadSerializer(ModelSerializer):
 
 
 class Base64ImageField(ImageField):
-    """Сериализатор картинок в рецептах."""
+    """
+    Сериализатор картинок в рецептах.
+    Размер файла проверяется до декодирования, base64 декодируется
+    частями во временный файл, а размер в пикселях берётся из заголовка
+    изображения без распаковки всей картинки.
+    """
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            if len(imgstr) * 3 // 4 > settings.IMAGE_MAX_UPLOAD_SIZE:
+                raise ValidationError('Слишком большой файл изображения.')
+            data = File(decode_base64(imgstr), name='temp.' + ext)
+        elif getattr(data, 'size', 0) > settings.IMAGE_MAX_UPLOAD_SIZE:
+            raise ValidationError('Слишком большой файл изображения.')
+        check_image_pixels(data)
         return super().to_internal_value(data)
 
 
@@ -77,11 +93,8 @@ class UserSerializer(ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-
-        user = self.context.get('request').user
-        if user is None or user.is_anonymous:
-            return False
-        return user.follower.filter(author=obj).exists()
+        request = self.context.get('request')
+        return obj.pk in get_relations(request).following_ids
 
 
 class UserCreateSerializer(ModelSerializer):
@@ -98,6 +111,7 @@ class ShoppingListFavoiriteSerializer(ModelSerializer):
     """Сериализация объектов типа shoppingLists. Лист покупок."""
 
     image = Base64ImageField(read_only=True)
+    image_thumb = ImageField(read_only=True)
     name = ReadOnlyField()
     cooking_time = ReadOnlyField()
 
@@ -107,6 +121,7 @@ class ShoppingListFavoiriteSerializer(ModelSerializer):
             'id',
             'name',
             'image',
+            'image_thumb',
             'cooking_time',
         )
 
@@ -137,7 +152,7 @@ class FollowSerializer(ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        return Follow.objects.filter(user=obj.user, author=obj.author).exists()
+        return True
 
     def validate(self, data):
         author = self.instance
@@ -153,15 +168,21 @@ class FollowSerializer(ModelSerializer):
         return data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return Recipe.objects.filter(author=obj.author).count()
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        query_params = request.query_params
-        queryset = Recipe.objects.filter(author=obj.author)
-        if 'recipes_limit' in query_params:
-            recipes_limit = query_params['recipes_limit']
-            queryset = queryset[:int(recipes_limit)]
+        recipes_by_author = self.context.get('recipes_by_author')
+        if recipes_by_author is not None:
+            queryset = recipes_by_author.get(obj.author_id, [])
+        else:
+            request = self.context.get('request')
+            query_params = request.query_params
+            queryset = Recipe.objects.filter(author=obj.author)
+            if 'recipes_limit' in query_params:
+                recipes_limit = query_params['recipes_limit']
+                queryset = queryset[:int(recipes_limit)]
         serializer = ShoppingListFavoiriteSerializer(queryset, many=True)
         return serializer.data
 
@@ -193,6 +214,7 @@ class RecipesReadSerializer(ModelSerializer):
         read_only=True
     )
     image = Base64ImageField()
+    image_thumb = ImageField(read_only=True)
 
     class Meta:
         model = Recipe
@@ -203,6 +225,7 @@ class RecipesReadSerializer(ModelSerializer):
             'ingredients',
             'name',
             'image',
+            'image_thumb',
             'text',
             'cooking_time',
             'is_favorited',
@@ -210,17 +233,24 @@ class RecipesReadSerializer(ModelSerializer):
         )
 
     def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        return (
-            user.is_authenticated
-            and obj.favorite_recipes.filter(user=user).exists()
-        )
+        request = self.context.get('request')
+        return obj.pk in get_relations(request).favorite_ids
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        return (
-            user.is_authenticated
-            and obj.shopping_recipes.filter(user=user).exists()
+        request = self.context.get('request')
+        return obj.pk in get_relations(request).cart_ids
+
+
+class CookableRecipeSerializer(RecipesReadSerializer):
+    """Рецепт с числом имеющихся и недостающих ингредиентов."""
+
+    matched_ingredients = IntegerField(read_only=True)
+    missing_ingredients = IntegerField(read_only=True)
+
+    class Meta(RecipesReadSerializer.Meta):
+        fields = RecipesReadSerializer.Meta.fields + (
+            'matched_ingredients',
+            'missing_ingredients',
         )
 
 
@@ -287,6 +317,8 @@ class RecipesWriteSerializer(ModelSerializer):
         return value
 
     def create_update_ingredient(self, ingredients, recipe):
+        if not ingredients:
+            return
         IngredientInRecipesAmount.objects.bulk_create(
             [IngredientInRecipesAmount(
                 ingredient=ingredient.get('id'),
@@ -295,6 +327,59 @@ class RecipesWriteSerializer(ModelSerializer):
             ) for ingredient in ingredients]
         )
 
+    def update_tags(self, recipe, tags):
+        """Добавляет новые и убирает лишние теги, не трогая остальные."""
+        current_ids = set(recipe.tags.values_list('id', flat=True))
+        new_ids = {tag.id for tag in tags}
+        if current_ids - new_ids:
+            recipe.tags.remove(*(current_ids - new_ids))
+        if new_ids - current_ids:
+            recipe.tags.add(*(new_ids - current_ids))
+
+    def update_ingredients(self, recipe, ingredients):
+        """
+        Применяет к ингредиентам рецепта только разницу: удаляет лишние,
+        обновляет изменившееся количество и добавляет новые.
+        Возвращает True, если изменился состав ингредиентов.
+        """
+        current = {
+            ingredient.ingredient_id: ingredient
+            for ingredient in recipe.recipe.all()
+        }
+        new_amounts = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed_ids = current.keys() - new_amounts.keys()
+        if removed_ids:
+            IngredientInRecipesAmount.objects.filter(
+                recipe=recipe, ingredient_id__in=removed_ids
+            ).delete()
+        # Удалённые строки учитывает в списках покупок и индексе подбора
+        # сигнал post_delete, а bulk_update и bulk_create сигналов
+        # не вызывают.
+        delta = {}
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            ingredient = current.get(ingredient_id)
+            if ingredient is None:
+                delta[ingredient_id] = amount
+            elif ingredient.amount != amount:
+                delta[ingredient_id] = amount - ingredient.amount
+                ingredient.amount = amount
+                changed.append(ingredient)
+        if changed:
+            IngredientInRecipesAmount.objects.bulk_update(changed, ['amount'])
+        added = [
+            ingredient for ingredient in ingredients
+            if ingredient['id'].id not in current
+        ]
+        self.create_update_ingredient(added, recipe)
+        shopping_list.change_recipe(recipe.pk, delta)
+        if added and not removed_ids:
+            matching.record_change(recipe.pk)
+        return bool(removed_ids or added)
+
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('recipe')
@@ -302,6 +387,10 @@ class RecipesWriteSerializer(ModelSerializer):
         recipe = Recipe.objects.create(author=user, **validated_data)
         recipe.tags.set(tags)
         self.create_update_ingredient(ingredients, recipe)
+        search.update_recipes([recipe.pk])
+        matching.record_change(recipe.pk)
+        feed.publish(recipe)
+        schedule_thumbnail(recipe.pk)
         return recipe
 
     def update(self, instance, validated_data):
@@ -309,12 +398,25 @@ class RecipesWriteSerializer(ModelSerializer):
         if request.user.is_authenticated and \
            request.user.id == instance.author_id:
             tags = validated_data.pop('tags')
-            instance.tags.clear()
-            instance.tags.set(tags)
             ingredients = validated_data.pop('recipe')
-            instance.ingredients.clear()
-            self.create_update_ingredient(ingredients, instance)
-            return super().update(instance, validated_data)
+            with transaction.atomic():
+                self.update_tags(instance, tags)
+                search_changed = self.update_ingredients(instance, ingredients)
+                image = instance.image.name
+                for attr, value in validated_data.items():
+                    search_changed |= (
+                        attr in ('name', 'text')
+                        and getattr(instance, attr) != value
+                    )
+                    setattr(instance, attr, value)
+                instance.save(update_fields=validated_data.keys())
+                if search_changed:
+                    search.update_recipes([instance.pk])
+                if instance.image.name != image:
+                    instance.image_thumb = ''
+                    instance.save(update_fields=['image_thumb'])
+                    schedule_thumbnail(instance.pk)
+                return instance
         else:
             raise ValidationError('Вы не можете редактировать этот рецепт')
             return instance
@@ -0,0 +1,592 @@
+import re
+from unittest import skipUnless
+
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from recipes import feed, matching, shopping_list
+from recipes.cache import version_label
+from recipes.models import (DataVersion, FavoriteReceipe, Ingredient,
+                            IngredientInRecipesAmount, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag)
+from users.models import Follow, User
+
+from .serializers import RecipesWriteSerializer
+from .views import RecipeViewSet
+
+RECIPES_URL = '/api/recipes/'
+WRITE_STATEMENT = re.compile(r'(INSERT INTO|UPDATE|DELETE FROM) "?(\w+)"?')
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username,
+        email=f'{username}@example.com',
+        password='password',
+        first_name=username,
+        last_name=username,
+    )
+
+
+def bump_version_in_db(model):
+    """Изменение данных другим процессом: меняется только запись в базе."""
+    DataVersion.objects.filter(label=version_label(model)).update(
+        version=F('version') + 1, updated_at=timezone.now()
+    )
+
+
+class RecipeDataMixin:
+    """Пользователи, теги, ингредиенты и рецепты для тестов API."""
+
+    recipes_count = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('user')
+        cls.author = create_user('author')
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {index}', color=f'#00000{index}',
+                slug=f'tag{index}',
+            )
+            for index in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit=unit)
+            for name, unit in (
+                ('соль', 'г'), ('мука', 'г'), ('молоко', 'мл'),
+                ('яйца', 'шт.'), ('сахар', 'г'),
+            )
+        ]
+        cls.recipes = []
+        for index in range(cls.recipes_count):
+            recipe = Recipe.objects.create(
+                author=cls.author if index % 2 else cls.user,
+                name=f'Рецепт {index}',
+                image='recipes/test.png',
+                text='Описание',
+                cooking_time=10,
+            )
+            recipe.tags.set(cls.tags[index % 3:index % 3 + 2])
+            IngredientInRecipesAmount.objects.bulk_create(
+                IngredientInRecipesAmount(
+                    recipe=recipe, ingredient=ingredient, amount=100
+                )
+                for ingredient in cls.ingredients[index % 3:index % 3 + 3]
+            )
+            cls.recipes.append(recipe)
+        for recipe in cls.recipes[:4]:
+            FavoriteReceipe.objects.create(user=cls.user, recipe=recipe)
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.guest_client = APIClient()
+        self.user_client = APIClient()
+        self.user_client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+
+
+class RecipeListQueriesTest(RecipeDataMixin, TestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    # COUNT, рецепты с авторами, теги, ингредиенты.
+    guest_queries = 4
+    # Плюс токен, подписки, избранное и список покупок пользователя.
+    user_queries = guest_queries + 4
+
+    def assert_list_queries(self, client, queries):
+        for limit in (1, 5, self.recipes_count):
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(queries):
+                    response = client.get(RECIPES_URL, {'limit': limit})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_guest_list_queries(self):
+        self.assert_list_queries(self.guest_client, self.guest_queries)
+
+    def test_user_list_queries(self):
+        self.assert_list_queries(self.user_client, self.user_queries)
+
+    def test_search_vector_not_loaded(self):
+        with CaptureQueriesContext(connection) as context:
+            self.user_client.get(RECIPES_URL, {'limit': 5})
+            self.user_client.get(f'{RECIPES_URL}{self.recipes[0].id}/')
+            self.user_client.get(
+                '/api/users/subscriptions/', {'recipes_limit': 2}
+            )
+        for query in context.captured_queries:
+            self.assertNotIn('search_vector', query['sql'])
+
+    def test_user_list_relations(self):
+        response = self.user_client.get(
+            RECIPES_URL, {'limit': self.recipes_count}
+        )
+        favorite_ids = {recipe.pk for recipe in self.recipes[:4]}
+        for recipe in response.data['results']:
+            self.assertEqual(
+                recipe['is_favorited'], recipe['id'] in favorite_ids
+            )
+            self.assertEqual(
+                recipe['is_in_shopping_cart'], recipe['id'] in favorite_ids
+            )
+            self.assertEqual(
+                recipe['author']['is_subscribed'],
+                recipe['author']['id'] == self.author.id,
+            )
+
+
+class RecipeUpdateStatementsTest(RecipeDataMixin, TestCase):
+    """Изменение рецепта пишет в базу только изменившиеся данные."""
+
+    amounts_table = IngredientInRecipesAmount._meta.db_table
+    recipes_table = Recipe._meta.db_table
+
+    def setUp(self):
+        super().setUp()
+        # Рецепт не в списках покупок: сводные списки не меняются.
+        self.recipe = self.recipes[4]
+
+    def update(self, amounts):
+        """
+        Сохраняет рецепт с ингредиентами {ингредиент: количество} и
+        возвращает пары (операция, таблица) пишущих запросов.
+        """
+        recipe = self.recipe
+        request = APIRequestFactory().patch(RECIPES_URL)
+        request.user = recipe.author
+        serializer = RecipesWriteSerializer(
+            recipe,
+            data={
+                'tags': [tag.id for tag in recipe.tags.all()],
+                'ingredients': [
+                    {'id': ingredient.id, 'amount': amount}
+                    for ingredient, amount in amounts.items()
+                ],
+                'name': recipe.name,
+                'text': recipe.text,
+                'cooking_time': recipe.cooking_time,
+            },
+            partial=True,
+            context={'request': request},
+        )
+        serializer.is_valid(raise_exception=True)
+        with CaptureQueriesContext(connection) as context:
+            serializer.save()
+        return [
+            match.groups() for match in (
+                WRITE_STATEMENT.match(query['sql'])
+                for query in context.captured_queries
+            ) if match
+        ]
+
+    def test_unchanged_recipe(self):
+        statements = self.update(
+            {ingredient: 100 for ingredient in self.ingredients[1:4]}
+        )
+        self.assertEqual(statements, [('UPDATE', self.recipes_table)])
+
+    def test_changed_amount(self):
+        amounts = {ingredient: 100 for ingredient in self.ingredients[1:4]}
+        amounts[self.ingredients[1]] = 250
+        statements = self.update(amounts)
+        self.assertEqual(statements, [
+            ('UPDATE', self.amounts_table),
+            ('UPDATE', self.recipes_table),
+        ])
+        self.assertEqual(
+            self.recipe.recipe.get(ingredient=self.ingredients[1]).amount,
+            250,
+        )
+
+    def test_added_and_removed_ingredient(self):
+        statements = self.update(
+            {ingredient: 100 for ingredient in self.ingredients[2:5]}
+        )
+        self.assertEqual(
+            [
+                operation for operation, table in statements
+                if table == self.amounts_table
+            ],
+            ['DELETE FROM', 'INSERT INTO'],
+        )
+        self.assertEqual(
+            set(self.recipe.recipe.values_list('ingredient_id', flat=True)),
+            {ingredient.id for ingredient in self.ingredients[2:5]},
+        )
+
+
+class CachedVersionsTest(RecipeDataMixin, TestCase):
+    """Кэши под версией из базы видят изменения других процессов."""
+
+    def test_tag_added_by_other_process(self):
+        response = self.guest_client.get(
+            RECIPES_URL, {'tags': self.tags[0].slug, 'limit': 1}
+        )
+        self.assertEqual(response.status_code, 200)
+        Tag.objects.bulk_create(
+            [Tag(name='Новый тег', color='#0000FF', slug='new')]
+        )
+        bump_version_in_db(Tag)
+        response = self.guest_client.get(
+            RECIPES_URL, {'tags': 'new', 'limit': 1}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 0)
+
+    def test_tags_read_once_per_request(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(
+                RECIPES_URL, {'tags': self.tags[0].slug, 'limit': 1}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([
+            query for query in queries
+            if 'recipes_dataversion' in query['sql']
+        ]), 1)
+
+    def test_ingredient_added_by_other_process(self):
+        url = '/api/ingredients/'
+        response = self.guest_client.get(url, {'name': 'со'})
+        self.assertEqual(
+            [ingredient['name'] for ingredient in response.data], ['соль']
+        )
+        Ingredient.objects.bulk_create([Ingredient(
+            name='солод', measurement_unit='г', search_name='солод'
+        )])
+        bump_version_in_db(Ingredient)
+        response = self.guest_client.get(url, {'name': 'со'})
+        self.assertEqual(
+            [ingredient['name'] for ingredient in response.data],
+            ['солод', 'соль'],
+        )
+
+    def test_reference_conditional_headers(self):
+        url = '/api/tags/'
+        response = self.guest_client.get(url)
+        updated_at = DataVersion.objects.get(
+            label=version_label(Tag)
+        ).updated_at
+        self.assertEqual(
+            response['Last-Modified'], http_date(updated_at.timestamp())
+        )
+        response = self.guest_client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+        bump_version_in_db(Tag)
+        response = self.guest_client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class ShoppingListTest(RecipeDataMixin, TestCase):
+    """
+    Сводные списки покупок после любых изменений совпадают с собранными
+    заново по корзинам (shopping_list.rebuild).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for recipe in cls.recipes[:3]:
+            ShoppingCart.objects.create(user=cls.author, recipe=recipe)
+
+    def assert_matches_rebuild(self):
+        def items():
+            return set(ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'total_amount'
+            ))
+
+        current = items()
+        shopping_list.rebuild()
+        self.assertEqual(current, items())
+
+    def test_initial_lists(self):
+        self.assertTrue(ShoppingListItem.objects.filter(
+            user=self.author
+        ).exists())
+        self.assert_matches_rebuild()
+
+    def test_add_and_remove_through_api(self):
+        url = f'{RECIPES_URL}{self.recipes[6].id}/shopping_cart/'
+        self.assertEqual(self.user_client.post(url).status_code, 201)
+        self.assert_matches_rebuild()
+        url = f'{RECIPES_URL}{self.recipes[0].id}/shopping_cart/'
+        self.assertEqual(self.user_client.delete(url).status_code, 204)
+        self.assert_matches_rebuild()
+
+    def test_cart_rows_from_admin(self):
+        cart = ShoppingCart.objects.create(
+            user=self.author, recipe=self.recipes[5]
+        )
+        self.assert_matches_rebuild()
+        cart.recipe = self.recipes[7]
+        cart.save()
+        self.assert_matches_rebuild()
+        ShoppingCart.objects.filter(user=self.user).delete()
+        self.assert_matches_rebuild()
+        self.assertFalse(ShoppingListItem.objects.filter(
+            user=self.user
+        ).exists())
+
+    def test_edit_amounts_through_api(self):
+        recipe = self.recipes[0]
+        response = self.user_client.patch(
+            f'{RECIPES_URL}{recipe.id}/',
+            {
+                'tags': [self.tags[0].id],
+                'ingredients': [
+                    {'id': self.ingredients[1].id, 'amount': 250},
+                    {'id': self.ingredients[2].id, 'amount': 100},
+                    {'id': self.ingredients[4].id, 'amount': 30},
+                ],
+                'name': recipe.name,
+                'text': recipe.text,
+                'cooking_time': recipe.cooking_time,
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_matches_rebuild()
+
+    def test_edit_amounts_from_admin(self):
+        amounts = list(self.recipes[1].recipe.order_by('id'))
+        amounts[0].amount = 7
+        amounts[0].save()
+        self.assert_matches_rebuild()
+        amounts[1].ingredient = self.ingredients[0]
+        amounts[1].save()
+        self.assert_matches_rebuild()
+        amounts[2].delete()
+        self.assert_matches_rebuild()
+        IngredientInRecipesAmount.objects.create(
+            recipe=self.recipes[1], ingredient=self.ingredients[4], amount=5
+        )
+        self.assert_matches_rebuild()
+
+    def test_delete_recipe_through_api(self):
+        response = self.user_client.delete(
+            f'{RECIPES_URL}{self.recipes[0].id}/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assert_matches_rebuild()
+
+    def test_delete_recipe_from_admin(self):
+        self.recipes[2].delete()
+        self.assert_matches_rebuild()
+
+    def test_delete_author(self):
+        self.author.delete()
+        self.assert_matches_rebuild()
+
+
+class ShoppingCartDownloadTest(RecipeDataMixin, TestCase):
+    """Список покупок выгружается во всех форматах."""
+
+    def download(self, file_format):
+        response = self.user_client.get(
+            f'{RECIPES_URL}download_shopping_cart/', {'format': file_format}
+        )
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_text_formats(self):
+        for file_format in ('txt', 'csv'):
+            with self.subTest(file_format=file_format):
+                self.assertIn('соль', self.download(file_format).decode())
+
+    def test_pdf(self):
+        content = self.download('pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertIn(b'DejaVuSans', content)
+
+
+class MatchingIndexTest(RecipeDataMixin, TestCase):
+    """
+    Индекс подбора рецептов, догнавший журнал изменений, совпадает
+    с собранным заново, как бы ни менялись ингредиенты и рецепты.
+    """
+
+    def setUp(self):
+        super().setUp()
+        matching._index = None
+        matching.get_index()
+
+    def assert_matches_rebuild(self):
+        def recipes(index):
+            return {
+                recipe_id: sorted(ingredient_ids)
+                for recipe_id, ingredient_ids in index.ingredients.items()
+            }
+
+        self.assertEqual(
+            recipes(matching.get_index()),
+            recipes(matching.IngredientIndex.from_db()),
+        )
+
+    def test_delete_recipe_from_admin(self):
+        self.recipes[2].delete()
+        self.assert_matches_rebuild()
+        response = self.guest_client.get(
+            f'{RECIPES_URL}can_cook/',
+            {'ingredients': self.ingredients[2].id, 'limit': 100},
+        )
+        count = Recipe.objects.filter(
+            recipe__ingredient=self.ingredients[2]
+        ).count()
+        self.assertEqual(response.data['count'], count)
+        self.assertEqual(len(response.data['results']), count)
+
+    def test_delete_author(self):
+        self.author.delete()
+        self.assert_matches_rebuild()
+
+    def test_edit_ingredients_from_admin(self):
+        amounts = list(self.recipes[1].recipe.order_by('id'))
+        amounts[0].ingredient = self.ingredients[0]
+        amounts[0].save()
+        self.assert_matches_rebuild()
+        amounts[1].delete()
+        self.assert_matches_rebuild()
+        IngredientInRecipesAmount.objects.create(
+            recipe=self.recipes[1], ingredient=self.ingredients[4], amount=5
+        )
+        self.assert_matches_rebuild()
+
+    def test_edit_ingredients_through_api(self):
+        recipe = self.recipes[0]
+        response = self.user_client.patch(
+            f'{RECIPES_URL}{recipe.id}/',
+            {
+                'tags': [self.tags[0].id],
+                'ingredients': [
+                    {'id': self.ingredients[1].id, 'amount': 250},
+                    {'id': self.ingredients[4].id, 'amount': 30},
+                ],
+                'name': recipe.name,
+                'text': recipe.text,
+                'cooking_time': recipe.cooking_time,
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_matches_rebuild()
+
+
+class FeedTest(RecipeDataMixin, TestCase):
+    """
+    Лента содержит все рецепты авторов из подписок, как бы ни менялось
+    число их подписчиков между публикацией и чтением.
+    """
+
+    def assert_feed_complete(self, user):
+        expected = list(Recipe.objects.filter(
+            author__following__user=user
+        ).order_by('-pub_date', '-id').values_list('pub_date', 'id'))
+        self.assertEqual(feed.page(user.id, 100), expected)
+        self.assertEqual(
+            feed.page(user.id, 3, expected[2]), expected[3:6]
+        )
+
+    def publish(self):
+        recipe = Recipe.objects.create(
+            author=self.author, name='Новый рецепт',
+            image='recipes/test.png', text='Описание', cooking_time=5,
+        )
+        feed.publish(recipe)
+        return recipe
+
+    def test_published_while_many_followers(self):
+        with override_settings(FEED_FANOUT_MAX_FOLLOWERS=0):
+            recipe = self.publish()
+            self.assert_feed_complete(self.user)
+        self.assertFalse(recipe.fanned_out)
+        self.assert_feed_complete(self.user)
+        follower = create_user('follower')
+        Follow.objects.create(user=follower, author=self.author)
+        feed.follow(follower.id, self.author.id)
+        self.assert_feed_complete(follower)
+
+    def test_followed_while_many_followers(self):
+        recipe = self.publish()
+        self.assertTrue(recipe.fanned_out)
+        follower = create_user('follower')
+        with override_settings(FEED_FANOUT_MAX_FOLLOWERS=0):
+            Follow.objects.create(user=follower, author=self.author)
+            feed.follow(follower.id, self.author.id)
+            self.assert_feed_complete(follower)
+        self.assert_feed_complete(follower)
+
+    def test_rebuild(self):
+        self.publish()
+        with override_settings(FEED_FANOUT_MAX_FOLLOWERS=0):
+            self.publish()
+            feed.rebuild()
+            self.assert_feed_complete(self.user)
+        feed.rebuild()
+        self.assert_feed_complete(self.user)
+        self.assertFalse(Recipe.objects.filter(
+            author=self.author, fanned_out=False
+        ).exists())
+
+
+@skipUnless(
+    connection.vendor == 'postgresql',
+    'Планы запросов проверяются только в PostgreSQL.',
+)
+class RecipeFilterPlansTest(RecipeDataMixin, TestCase):
+    """
+    Лента рецептов при всех комбинациях фильтров читает таблицы по
+    индексам. Последовательное сканирование запрещено, чтобы на малых
+    тестовых таблицах план был тем же, что и на больших.
+    """
+
+    checked_tables = (
+        Recipe._meta.db_table,
+        Recipe.tags.through._meta.db_table,
+        FavoriteReceipe._meta.db_table,
+        ShoppingCart._meta.db_table,
+        IngredientInRecipesAmount._meta.db_table,
+    )
+
+    def explain(self, params):
+        """План первой страницы ленты так, как её строит RecipeViewSet."""
+        request = Request(APIRequestFactory().get(RECIPES_URL, params))
+        request.user = self.user
+        view = RecipeViewSet(
+            request=request, action='list', format_kwarg=None, kwargs={}
+        )
+        queryset = view.filter_queryset(view.get_queryset())[:6]
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def test_filters_use_indexes(self):
+        tag = self.tags[0].slug
+        combinations = (
+            {},
+            {'tags': tag},
+            {'author': self.author.id},
+            {'is_favorited': 1},
+            {'is_in_shopping_cart': 1},
+            {'tags': tag, 'is_favorited': 1},
+            {'tags': tag, 'is_in_shopping_cart': 1},
+            {'author': self.author.id, 'tags': tag},
+        )
+        for params in combinations:
+            with self.subTest(**params):
+                plan = self.explain(params)
+                for table in self.checked_tables:
+                    self.assertNotRegex(plan, rf'Seq Scan on "?{table}"?\b')
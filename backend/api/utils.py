@@ -1,20 +1,140 @@
-from django.shortcuts import HttpResponse
+import csv
+from collections import defaultdict
+from io import BytesIO
+from pathlib import Path
 
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.http import StreamingHttpResponse
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
 
-def shopping_cart_file(ingredients):
-    """Загрузка списка покупок с ингредиентами."""
+from recipes.models import Recipe
 
-    shopping_list = 'Список покупок: \n'
+# Встроенные шрифты PDF не содержат кириллицы.
+PDF_FONT = 'DejaVuSans'
+PDF_FONT_PATH = Path(__file__).resolve().parent / 'fonts' / 'DejaVuSans.ttf'
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 16
+PDF_MARGIN = 20 * mm
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_cart_txt(ingredients):
+    """Строки списка покупок в текстовом формате."""
+
+    yield 'Список покупок: \n'
     for ingredient in ingredients:
-        shopping_list += (
-            f'{ingredient["ingredient__name"]} - '
+        yield (
+            f'{ingredient["name"]} - '
             f'{ingredient["amount_sum"]} '
-            f'({ingredient["ingredient__measurement_unit"]}) \n'
+            f'({ingredient["measurement_unit"]}) \n'
         )
-        response = HttpResponse(
-            shopping_list, content_type='text/plain; charset=utf8'
+
+
+def shopping_cart_csv(ingredients):
+    """Строки списка покупок в формате CSV."""
+
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['name'],
+            ingredient['amount_sum'],
+            ingredient['measurement_unit'],
+        ))
+
+
+def shopping_cart_pdf(ingredients):
+    """
+    Список покупок в PDF. Документ собирается целиком в памяти и
+    отдаётся одним куском: PDF нельзя дописывать по мере чтения строк.
+    """
+
+    if PDF_FONT not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(PDF_FONT, str(PDF_FONT_PATH)))
+    buffer = BytesIO()
+    canvas = Canvas(buffer, pagesize=A4)
+    canvas.setTitle('Список покупок')
+    width, height = A4
+    y = height - PDF_MARGIN
+
+    def write(text):
+        nonlocal y
+        for line in simpleSplit(
+            text, PDF_FONT, PDF_FONT_SIZE, width - 2 * PDF_MARGIN
+        ):
+            if y < PDF_MARGIN:
+                canvas.showPage()
+                y = height - PDF_MARGIN
+            canvas.setFont(PDF_FONT, PDF_FONT_SIZE)
+            canvas.drawString(PDF_MARGIN, y, line)
+            y -= PDF_LINE_HEIGHT
+
+    write('Список покупок:')
+    for ingredient in ingredients:
+        write(
+            f'{ingredient["name"]} - '
+            f'{ingredient["amount_sum"]} '
+            f'({ingredient["measurement_unit"]})'
         )
-        response[
-            'Content-Disposition'
-        ] = 'attachment; filename="shopping_cart.txt"'
+    canvas.save()
+    yield buffer.getvalue()
+
+
+SHOPPING_CART_FORMATS = {
+    'txt': (shopping_cart_txt, 'text/plain; charset=utf8'),
+    'csv': (shopping_cart_csv, 'text/csv; charset=utf8'),
+    'pdf': (shopping_cart_pdf, 'application/pdf'),
+}
+
+
+def shopping_cart_file(ingredients, file_format='txt'):
+    """
+    Загрузка списка покупок с ингредиентами.
+    Строки читаются из базы серверным курсором и отдаются клиенту потоком.
+    """
+
+    generator, content_type = SHOPPING_CART_FORMATS[file_format]
+    response = StreamingHttpResponse(
+        generator(ingredients.iterator()), content_type=content_type
+    )
+    response[
+        'Content-Disposition'
+    ] = f'attachment; filename="shopping_cart.{file_format}"'
     return response
+
+
+def recipes_by_author(author_ids, limit=None):
+    """
+    Рецепты авторов страницы подписок одним запросом.
+    При заданном limit каждому автору достаются limit последних рецептов,
+    отобранных оконной функцией ROW_NUMBER() OVER (PARTITION BY author).
+    """
+    recipes = Recipe.objects.filter(author_id__in=author_ids)
+    if limit is not None:
+        ranked = recipes.annotate(recipe_rank=Window(
+            expression=RowNumber(),
+            partition_by=F('author'),
+            order_by=F('pub_date').desc(),
+        ))
+        sql, params = ranked.query.sql_with_params()
+        recipes = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) ranked '
+            f'WHERE ranked.recipe_rank <= %s ORDER BY ranked.recipe_rank',
+            (*params, limit),
+        )
+    result = defaultdict(list)
+    for recipe in recipes:
+        result[recipe.author_id].append(recipe)
+    return result
@@ -1,40 +1,67 @@
-from django.db.models import Sum
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Prefetch, Sum
+from django.db.models.functions import Greatest
 from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_datetime
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import (IsAdminUser, IsAuthenticated,
+                                        SAFE_METHODS)
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
 
+from recipes import feed, matching, search, units
 from recipes.models import (FavoriteReceipe, Ingredient,
                             IngredientInRecipesAmount, Recipe, ShoppingCart,
-                            Tag)
+                            ShoppingListItem, Tag)
 from users.models import Follow, User
 
 from .filters import RecipeFilter, IngredientFilter
-from .pagination import LimitPaginator
+from .middleware import request_stats
+from .mixins import CachedReferenceMixin
+from .pagination import (LimitPaginator, RecipeCursorPaginator,
+                         RecipeMatchPaginator)
 from .permission import OwnerOrReadOnly
-from .serializers import (FollowSerializer, IngredientSerializer,
-                          RecipesReadSerializer, RecipesWriteSerializer,
+from .renderers import (ShoppingCartCsvRenderer, ShoppingCartPdfRenderer,
+                        ShoppingCartTxtRenderer)
+from .serializers import (CookableRecipeSerializer, FollowSerializer,
+                          IngredientSerializer, RecipesReadSerializer,
+                          RecipesWriteSerializer,
                           ShoppingListFavoiriteSerializer, TagSerializer,
                           UserSerializer)
-from .utils import shopping_cart_file
+from .utils import recipes_by_author, shopping_cart_file
 
 
-class TagsViewSet(viewsets.ModelViewSet):
+class MetricsView(APIView):
+    """Статистика времени и SQL-запросов по представлениям. Для персонала."""
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(request_stats.report())
+
+    def delete(self, request):
+        request_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class TagsViewSet(CachedReferenceMixin, viewsets.ModelViewSet):
     """Класс взаимодействия с моделью Tags. Вьюсет для списка тегов."""
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
-class IngredientsViewSet(viewsets.ModelViewSet):
+class IngredientsViewSet(CachedReferenceMixin, viewsets.ModelViewSet):
     """Класс взаимодействия с Ingredients. Вьюсет для ингредиентов."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = [IngredientFilter]
-    search_fields = ('^name', )
 
 
 class UsersViewSet(UserViewSet):
@@ -59,11 +86,29 @@ class UsersViewSet(UserViewSet):
     )
     def subscriptions(self, request):
         user = self.request.user
-        queryset = Follow.objects.filter(user=user)
+        queryset = Follow.objects.filter(user=user).select_related(
+            'author'
+        ).annotate(recipes_count=Count('author__recipes')).order_by('id')
         page = self.paginate_queryset(queryset)
+        recipes_limit = request.query_params.get('recipes_limit')
+        if recipes_limit is not None:
+            try:
+                recipes_limit = int(recipes_limit)
+            except ValueError:
+                raise ValidationError(
+                    {'recipes_limit': 'Укажите целое число.'}
+                )
+        follows = queryset if page is None else page
         serializer = FollowSerializer(
-            page, many=True, context={'request': request}
+            follows, many=True, context={
+                'request': request,
+                'recipes_by_author': recipes_by_author(
+                    [follow.author_id for follow in follows], recipes_limit
+                ),
+            }
         )
+        if page is None:
+            return Response(serializer.data)
         return self.get_paginated_response(serializer.data)
 
     @action(
@@ -74,14 +119,16 @@ class UsersViewSet(UserViewSet):
         user = request.user
         author = get_object_or_404(User, id=id)
         if request.method == 'POST':
+            follow = Follow.objects.create(user=user, author=author)
+            feed.follow(user.id, author.id)
             serializer = FollowSerializer(
-                Follow.objects.create(user=user, author=author),
-                context={'request': request},
+                follow, context={'request': request},
             )
             return Response(
                 serializer.data, status=status.HTTP_201_CREATED
             )
         Follow.objects.filter(user=user, author=author).delete()
+        feed.unfollow(user.id, author.id)
         return Response('Успешная отписка', status=status.HTTP_204_NO_CONTENT)
 
 
@@ -94,43 +141,105 @@ class RecipeViewSet(viewsets.ModelViewSet):
     permission_class = (OwnerOrReadOnly,)
     pagination_class = LimitPaginator
 
+    @property
+    def paginator(self):
+        """Курсорная пагинация включается параметром ?pagination=cursor."""
+        if self.request.query_params.get('pagination') == 'cursor':
+            if not hasattr(self, '_paginator'):
+                self._paginator = RecipeCursorPaginator()
+            return self._paginator
+        return super().paginator
+
+    def get_queryset(self):
+        """
+        Загружает связанные данные рецептов фиксированным числом запросов,
+        не зависящим от размера страницы.
+        """
+        queryset = super().get_queryset()
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        return queryset.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe',
+                queryset=IngredientInRecipesAmount.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        )
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipesReadSerializer
         return RecipesWriteSerializer
 
-    def post_delete_recipe(self, request, pk, model):
-        recipe = get_object_or_404(Recipe, pk=pk)
+    def list(self, request, *args, **kwargs):
+        query = request.query_params.get('search', '').strip()
+        if not query or search.uses_database_ranking():
+            return super().list(request, *args, **kwargs)
+        return self.search_list(request, query)
+
+    def search_list(self, request, query):
+        """
+        Поиск без полнотекстового индекса в базе: id отфильтрованных
+        рецептов ранжируются в Python, из базы загружается только
+        страница. Пагинация всегда по ?limit и ?page.
+        """
+        recipe_ids = self.filter_queryset(self.get_queryset()).order_by(
+            '-pub_date', '-id'
+        ).values_list('pk', flat=True)
+        ranked = search.rank_recipes(recipe_ids, query)
+        paginator = LimitPaginator()
+        page = paginator.paginate_queryset(ranked, request, view=self)
+        page_ids = ranked if page is None else page
+        recipes = self.get_queryset().in_bulk(page_ids)
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in page_ids if pk in recipes], many=True
+        )
+        if page is None:
+            return Response(serializer.data)
+        return paginator.get_paginated_response(serializer.data)
+
+    def post_delete_recipe(self, request, pk, model, counter):
+        """
+        Добавление и удаление рецепта одним запросом к таблице связи.
+        Повторное добавление отсекается уникальным ограничением в базе,
+        а не предварительной проверкой.
+        """
         user = self.request.user
         if request.method == 'POST':
-            serializer = ShoppingListFavoiriteSerializer(recipe)
-            if model.objects.filter(
-                    user=user, recipe=recipe
-            ).exists():
+            recipe = get_object_or_404(Recipe, pk=pk)
+            try:
+                with transaction.atomic():
+                    model.objects.create(user=user, recipe=recipe)
+                    Recipe.objects.filter(pk=recipe.pk).update(
+                        **{counter: F(counter) + 1}
+                    )
+            except IntegrityError:
                 return Response(
                     {'errors': 'Рецепт уже добавлен!'},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            else:
-                model.objects.create(
-                    user=user, recipe=recipe
+            serializer = ShoppingListFavoiriteSerializer(recipe)
+            return Response(
+                serializer.data,
+                status=status.HTTP_201_CREATED)
+        with transaction.atomic():
+            deleted, _ = model.objects.filter(
+                user=user, recipe_id=pk
+            ).delete()
+            if deleted:
+                # Счётчик мог разойтись со связями (записи из админки),
+                # поэтому не опускаем его ниже нуля.
+                Recipe.objects.filter(pk=pk).update(
+                    **{counter: Greatest(F(counter) - 1, 0)}
                 )
-                return Response(
-                    serializer.data,
-                    status=status.HTTP_201_CREATED)
-        elif request.method == 'DELETE':
-            if model.objects.filter(
-                user=user, recipe=recipe
-            ).exists():
-                model.objects.get(
-                    user=user, recipe=recipe
-                ).delete()
                 return Response(status=status.HTTP_204_NO_CONTENT)
-            else:
-                return Response(
-                    {'errors': 'Рецепт уже удален!'},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
+        get_object_or_404(Recipe, pk=pk)
+        return Response(
+            {'errors': 'Рецепт уже удален!'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
     @action(
         methods=['POST', 'DELETE'], detail=True,
@@ -138,29 +247,180 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def favorite(self, request, **kwargs):
         return self.post_delete_recipe(
-            request, kwargs.pop('pk'), FavoriteReceipe)
+            request, kwargs.pop('pk'), FavoriteReceipe, 'favorites_count')
 
     @action(
         methods=['POST', 'DELETE'], detail=True,
     )
     def shopping_cart(self, request, **kwargs):
         return self.post_delete_recipe(
-            request, kwargs.pop('pk'), ShoppingCart)
+            request, kwargs.pop('pk'), ShoppingCart, 'in_carts_count')
+
+    def get_limit(self, request):
+        """Размер выборки из ?limit для списков без постраничной навигации."""
+        limit = request.query_params.get('limit')
+        try:
+            limit = RecipeCursorPaginator.page_size if limit is None else int(
+                limit
+            )
+        except ValueError:
+            raise ValidationError({'limit': 'Укажите целое число.'})
+        if not 0 < limit <= settings.MAX_PAGE_SIZE:
+            raise ValidationError({
+                'limit': f'Не больше {settings.MAX_PAGE_SIZE}.'
+            })
+        return limit
+
+    def get_feed_params(self, request):
+        limit = self.get_limit(request)
+        cursor = request.query_params.get('cursor')
+        if cursor is None:
+            return limit, None
+        pub_date, _, recipe_id = cursor.rpartition('_')
+        try:
+            before = (parse_datetime(pub_date), int(recipe_id))
+        except ValueError:
+            before = (None, None)
+        if before[0] is None:
+            raise ValidationError({'cursor': 'Неверный курсор.'})
+        return limit, before
 
     @action(
         methods=['GET'], detail=False,
-        permission_class=(IsAuthenticated,)
+        permission_classes=(IsAuthenticated,),
     )
-    def download_shopping_cart(self, request):
-        ingredients = IngredientInRecipesAmount.objects.select_related(
-            'recipe', 'ingredient'
+    def feed(self, request):
+        """
+        Лента рецептов авторов из подписок, новые сверху. Страницы
+        переключаются по ссылке next (?cursor=).
+        """
+        limit, before = self.get_feed_params(request)
+        items = feed.page(request.user.id, limit, before)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for _, recipe_id in items]
         )
-        ingredients = ingredients.filter(
-            recipe__shopping_recipes__user=request.user
+        serializer = RecipesReadSerializer(
+            [
+                recipes[recipe_id] for _, recipe_id in items
+                if recipe_id in recipes
+            ],
+            many=True, context={'request': request},
         )
-        ingredients = ingredients.values(
-            'ingredient__name', 'ingredient__measurement_unit'
+        next_url = None
+        if len(items) == limit:
+            pub_date, recipe_id = items[-1]
+            next_url = replace_query_param(
+                request.build_absolute_uri(), 'cursor',
+                f'{pub_date.isoformat()}_{recipe_id}',
+            )
+        return Response({'next': next_url, 'results': serializer.data})
+
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk):
+        """Похожие рецепты из таблицы, посчитанной build_recommendations."""
+        get_object_or_404(Recipe, pk=pk)
+        recipes = self.get_queryset().filter(
+            similar_to__recipe_id=pk
+        ).order_by('-similar_to__score', '-id')[:self.get_limit(request)]
+        serializer = RecipesReadSerializer(
+            recipes, many=True, context={'request': request}
+        )
+        return Response(serializer.data)
+
+    @action(
+        methods=['GET'], detail=False,
+        permission_classes=(IsAuthenticated,),
+    )
+    def recommended(self, request):
+        """
+        Рекомендации: рецепты, похожие на последние избранные рецепты
+        пользователя, по сумме близости. Уже избранные не предлагаются.
+        """
+        user = request.user
+        favorites = FavoriteReceipe.objects.filter(
+            user=user
+        ).order_by('-id').values('recipe_id')[
+            :settings.RECOMMENDATION_FAVORITES
+        ]
+        recipes = self.get_queryset().filter(
+            similar_to__recipe_id__in=favorites
+        ).exclude(
+            favorite_recipes__user=user
+        ).annotate(
+            recommendation_score=Sum('similar_to__score')
+        ).order_by('-recommendation_score', '-id')[:self.get_limit(request)]
+        serializer = RecipesReadSerializer(
+            recipes, many=True, context={'request': request}
+        )
+        return Response(serializer.data)
+
+    def get_can_cook_params(self, request):
+        try:
+            ingredient_ids = [
+                int(value)
+                for value in request.query_params.getlist('ingredients')
+            ]
+        except ValueError:
+            raise ValidationError({'ingredients': 'Укажите id ингредиентов.'})
+        if not ingredient_ids:
+            raise ValidationError({'ingredients': 'Укажите ингредиенты.'})
+        max_missing = request.query_params.get('max_missing')
+        if max_missing is not None:
+            try:
+                max_missing = int(max_missing)
+            except ValueError:
+                raise ValidationError(
+                    {'max_missing': 'Укажите целое число.'}
+                )
+        return ingredient_ids, max_missing
+
+    @action(
+        methods=['GET'], detail=False,
+        pagination_class=RecipeMatchPaginator,
+    )
+    def can_cook(self, request):
+        """
+        Рецепты из имеющихся ингредиентов (?ingredients=1&ingredients=2),
+        ранжированные по числу недостающих. Подбор идёт по индексу
+        «ингредиент → рецепты» в памяти, из базы загружается только
+        страница результатов.
+        """
+        ingredient_ids, max_missing = self.get_can_cook_params(request)
+        matches = matching.get_index().match(ingredient_ids, max_missing)
+        matches = self.paginate_queryset(matches)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in matches]
+        )
+        result = []
+        for recipe_id, matched, missing in matches:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.matched_ingredients = matched
+                recipe.missing_ingredients = missing
+                result.append(recipe)
+        serializer = CookableRecipeSerializer(
+            result, many=True, context={'request': request}
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        methods=['GET'], detail=False,
+        permission_class=(IsAuthenticated,),
+        renderer_classes=(
+            ShoppingCartTxtRenderer, ShoppingCartCsvRenderer,
+            ShoppingCartPdfRenderer,
+        ),
+    )
+    def download_shopping_cart(self, request):
+        unit = 'ingredient__measurement_unit'
+        ingredients = ShoppingListItem.objects.filter(
+            user=request.user
+        ).annotate(
+            name=F('ingredient__name'),
+            measurement_unit=units.canonical_unit(unit),
+        ).values('name', 'measurement_unit').annotate(
+            amount_sum=Sum(F('total_amount') * units.unit_factor(unit)),
+        ).order_by('name', 'measurement_unit')
+        return shopping_cart_file(
+            ingredients, request.accepted_renderer.format
         )
-        ingredients = ingredients.annotate(amount_sum=Sum('amount'))
-        ingredients = ingredients.order_by('ingredient__name')
-        return shopping_cart_file(ingredients)
@@ -38,7 +38,7 @@ class IngredientInRecipesAmountInline(admin.TabularInline):
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     """Админ панель управления рецептами."""
-    list_display = ('name', 'author', 'get_in_favorites')
+    list_display = ('name', 'author', 'favorites_count', 'in_carts_count')
     list_filter = (
         'name',
         'author',
@@ -47,9 +47,6 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = (IngredientInRecipesAmountInline,)
     empty_value_display = '-пусто-'
 
-    def get_in_favorites(self, obj):
-        return obj.favorite_recipes.count()
-
 
 @admin.register(FavoriteReceipe)
 class FavoriteReceipeAdmin(admin.ModelAdmin):
@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DataVersion
+
+
+def version_label(model):
+    return model._meta.label_lower
+
+
+def version_info(model):
+    """
+    Версия данных модели из базы, общая для всех процессов: строка для
+    ключей кэша и время последнего изменения (None, если не менялись).
+    Время входит в строку, чтобы номер, начатый заново после очистки
+    базы, не совпал со старыми ключами.
+    """
+    row = DataVersion.objects.filter(
+        label=version_label(model)
+    ).values_list('version', 'updated_at').first()
+    if row is None:
+        return '0', None
+    version, updated_at = row
+    return f'{version}-{updated_at.timestamp():.6f}', updated_at
+
+
+def get_version(model):
+    """Версия данных модели для ключей кэша."""
+    return version_info(model)[0]
+
+
+def bump_version(model):
+    """Делает устаревшими все закэшированные данные модели."""
+    label = version_label(model)
+    now = timezone.now()
+    if DataVersion.objects.filter(label=label).update(
+        version=F('version') + 1, updated_at=now
+    ):
+        return
+    try:
+        with transaction.atomic():
+            DataVersion.objects.create(label=label, version=1, updated_at=now)
+    except IntegrityError:
+        # Запись успел создать другой процесс.
+        DataVersion.objects.filter(label=label).update(
+            version=F('version') + 1, updated_at=now
+        )
+
+
+def tag_ids_by_slug():
+    """
+    Словарь slug → id тегов под версией тегов из базы: тег, добавленный
+    любым процессом, сразу доступен в фильтре.
+    """
+    from .models import Tag
+
+    return cache.get_or_set(
+        f'tag-ids-by-slug:{get_version(Tag)}',
+        lambda: dict(Tag.objects.values_list('slug', 'id')),
+        timeout=settings.REFERENCE_CACHE_TIMEOUT,
+    )
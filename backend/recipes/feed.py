@@ -0,0 +1,137 @@
+from django.conf import settings
+from django.db.models import Count, Q
+
+from users.models import Follow
+
+from .models import FeedItem, Recipe
+
+
+def has_many_followers(author_id):
+    """Подписчиков больше FEED_FANOUT_MAX_FOLLOWERS (счёт с LIMIT)."""
+    limit = settings.FEED_FANOUT_MAX_FOLLOWERS
+    return Follow.objects.filter(
+        author_id=author_id
+    )[:limit + 1].count() > limit
+
+
+def pull_author_ids():
+    """Авторы, у которых сейчас подписчиков больше порога."""
+    return Follow.objects.values('author_id').annotate(
+        followers=Count('id')
+    ).filter(
+        followers__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values_list('author_id', flat=True)
+
+
+def publish(recipe):
+    """
+    Раскладывает новый рецепт по лентам подписчиков автора. Рецепт автора
+    с большим числом подписчиков остаётся с fanned_out=False и
+    подмешивается в ленты при чтении, даже если подписчиков потом станет
+    меньше.
+    """
+    if has_many_followers(recipe.author_id):
+        return
+    FeedItem.objects.bulk_create(
+        (
+            FeedItem(user_id=user_id, recipe=recipe, pub_date=recipe.pub_date)
+            for user_id in Follow.objects.filter(
+                author_id=recipe.author_id
+            ).values_list('user_id', flat=True).iterator()
+        ),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    Recipe.objects.filter(pk=recipe.pk).update(fanned_out=True)
+    recipe.fanned_out = True
+
+
+def follow(user_id, author_id):
+    """
+    Подписка: добавляет в ленту уже разложенные рецепты автора.
+    Остальные его рецепты подмешиваются при чтении.
+    """
+    FeedItem.objects.bulk_create(
+        (
+            FeedItem(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for recipe_id, pub_date in Recipe.objects.filter(
+                author_id=author_id, fanned_out=True
+            ).values_list('id', 'pub_date').iterator()
+        ),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def unfollow(user_id, author_id):
+    """Отписка: убирает рецепты автора из ленты."""
+    FeedItem.objects.filter(
+        user_id=user_id, recipe__author_id=author_id
+    ).delete()
+
+
+def page(user_id, limit, before=None):
+    """
+    Id рецептов ленты по убыванию (pub_date, id), не больше limit.
+    Записи ленты объединяются с неразложенными рецептами авторов из
+    подписок пользователя. before — (pub_date, id) последнего рецепта
+    предыдущей страницы.
+    """
+    pushed = FeedItem.objects.filter(user_id=user_id)
+    pulled = Recipe.objects.filter(
+        fanned_out=False,
+        author_id__in=Follow.objects.filter(
+            user_id=user_id
+        ).values('author_id'),
+    )
+    if before is not None:
+        pub_date, recipe_id = before
+        pushed = pushed.filter(
+            Q(pub_date__lt=pub_date)
+            | Q(pub_date=pub_date, recipe_id__lt=recipe_id)
+        )
+        pulled = pulled.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=recipe_id)
+        )
+    items = set(pushed.order_by('-pub_date', '-recipe_id').values_list(
+        'pub_date', 'recipe_id'
+    )[:limit])
+    items.update(pulled.order_by('-pub_date', '-id').values_list(
+        'pub_date', 'id'
+    )[:limit])
+    return sorted(items, reverse=True)[:limit]
+
+
+def rebuild(user_ids=None, batch_size=1000):
+    """
+    Пересобирает ленты по подпискам пользователей. Полная пересборка
+    заново решает, какие рецепты раскладывать, по текущему числу
+    подписчиков авторов.
+    """
+    items = FeedItem.objects.all()
+    recipes = Recipe.objects.filter(author__following__isnull=False)
+    if user_ids is None:
+        pull_authors = list(pull_author_ids())
+        Recipe.objects.filter(author_id__in=pull_authors).update(
+            fanned_out=False
+        )
+        Recipe.objects.exclude(author_id__in=pull_authors).update(
+            fanned_out=True
+        )
+    else:
+        items = items.filter(user_id__in=user_ids)
+        recipes = Recipe.objects.filter(
+            author__following__user_id__in=user_ids
+        )
+    items.delete()
+    FeedItem.objects.bulk_create(
+        (
+            FeedItem(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for user_id, recipe_id, pub_date in recipes.filter(
+                fanned_out=True
+            ).values_list(
+                'author__following__user_id', 'id', 'pub_date'
+            ).iterator()
+        ),
+        batch_size=batch_size,
+    )
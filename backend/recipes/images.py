@@ -0,0 +1,85 @@
+import base64
+import binascii
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+BASE64_CHUNK_SIZE = 64 * 1024
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_WORKERS, thread_name_prefix='thumbnails'
+)
+
+
+def decode_base64(data):
+    """Декодирует base64 частями во временный файл."""
+    file = tempfile.SpooledTemporaryFile(max_size=BASE64_CHUNK_SIZE * 16)
+    try:
+        for start in range(0, len(data), BASE64_CHUNK_SIZE):
+            file.write(base64.b64decode(
+                data[start:start + BASE64_CHUNK_SIZE], validate=True
+            ))
+    except binascii.Error:
+        file.close()
+        raise ValidationError('Некорректные данные изображения.')
+    file.seek(0)
+    return file
+
+
+def check_image_pixels(file):
+    """Проверяет размер изображения в пикселях по его заголовку."""
+    if not hasattr(file, 'read'):
+        return
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+    except Exception:
+        return
+    finally:
+        file.seek(0)
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise ValidationError('Слишком большое разрешение изображения.')
+
+
+def make_thumbnail(recipe_id):
+    """Создаёт WebP-миниатюру фотографии рецепта."""
+    try:
+        recipe = Recipe.objects.only('image').get(pk=recipe_id)
+        with recipe.image.open('rb') as file, Image.open(file) as image:
+            image.thumbnail(settings.IMAGE_THUMB_SIZE)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA')
+            buffer = BytesIO()
+            image.save(
+                buffer, 'WEBP', quality=settings.IMAGE_THUMB_QUALITY
+            )
+        name = os.path.splitext(os.path.basename(recipe.image.name))[0]
+        field = Recipe._meta.get_field('image_thumb')
+        thumb = field.storage.save(
+            field.generate_filename(recipe, f'{name}.webp'),
+            ContentFile(buffer.getvalue()),
+        )
+        Recipe.objects.filter(
+            pk=recipe_id, image=recipe.image.name
+        ).update(image_thumb=thumb)
+    except Exception:
+        logger.exception('Не удалось создать миниатюру рецепта %s', recipe_id)
+    finally:
+        connection.close()
+
+
+def schedule_thumbnail(recipe_id):
+    """Ставит создание миниатюры в фоновый пул после коммита транзакции."""
+    transaction.on_commit(lambda: executor.submit(make_thumbnail, recipe_id))
@@ -0,0 +1,76 @@
+import os
+import time
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from recipes.models import Recipe
+
+MEDIA_DIRECTORY = 'recipes'
+
+
+def walk_storage(storage, path):
+    """Обходит все файлы хранилища внутри каталога."""
+    directories, files = storage.listdir(path)
+    for file in files:
+        yield os.path.join(path, file).replace('\\', '/')
+    for directory in directories:
+        yield from walk_storage(storage, os.path.join(path, directory))
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из media файлы рецептов, на которые не ссылается '
+        'ни один рецепт.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60,
+            help='Не трогать файлы моложе указанного числа секунд.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, какие файлы будут удалены.',
+        )
+
+    def is_recent(self, storage, name, threshold):
+        return storage.get_modified_time(name).timestamp() > threshold
+
+    def handle(self, *args, **options):
+        references = Counter()
+        for image, image_thumb in Recipe.objects.values_list(
+            'image', 'image_thumb'
+        ).iterator():
+            references[image] += 1
+            references[image_thumb] += 1
+        storage = default_storage
+        if not storage.exists(MEDIA_DIRECTORY):
+            return
+        threshold = time.time() - options['min_age']
+        removed = 0
+        freed = 0
+        for name in walk_storage(storage, MEDIA_DIRECTORY):
+            if references[name]:
+                continue
+            if self.is_recent(storage, name, threshold):
+                continue
+            # Файл могли загрузить заново после снимка ссылок.
+            if Recipe.objects.filter(
+                Q(image=name) | Q(image_thumb=name)
+            ).exists() or self.is_recent(storage, name, threshold):
+                continue
+            freed += storage.size(name)
+            removed += 1
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                storage.delete(name)
+        shared = sum(1 for name, count in references.items()
+                     if name and count > 1)
+        self.stdout.write(self.style.SUCCESS(
+            f'Файлов без ссылок: {removed}, освобождено байт: {freed}. '
+            f'Файлов, используемых несколькими рецептами: {shared}.'
+        ))
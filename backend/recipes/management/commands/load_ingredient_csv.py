@@ -1,25 +1,88 @@
 import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
-from django.db import IntegrityError
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 
-from recipes.models import Ingredient
+from recipes.cache import bump_version
+from recipes.models import Ingredient, normalize_search_name
+
+DEFAULT_PATH = Path(settings.BASE_DIR) / 'recipes' / 'data' / 'ingredients.csv'
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        name, measurement_unit = row
+        yield name, measurement_unit
+
+
+def read_json(file):
+    for row in json.load(file):
+        yield row['name'], row['measurement_unit']
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
 
 
 class Command(BaseCommand):
+    help = (
+        'Загружает ингредиенты из CSV или JSON пачками. '
+        'Уже существующие ингредиенты пропускаются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=str(DEFAULT_PATH),
+            help='Путь к файлу с ингредиентами.',
+        )
+        parser.add_argument(
+            '--format', choices=READERS, dest='file_format',
+            help='Формат файла, по умолчанию определяется по расширению.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество строк в одном INSERT.',
+        )
 
     def handle(self, *args, **options):
-        file_name = 'recipes/data/ingredients.csv'
-        with open(file_name, 'r', encoding='utf-8') as file:
-            print(file)
-            file_reader = csv.reader(file)
-            for row in file_reader:
-                name, measurement_unit = row
-                try:
-                    Ingredient.objects.get_or_create(
+        path = Path(options['path'])
+        file_format = options['file_format'] or path.suffix.lstrip('.')
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('Размер пачки должен быть больше нуля.')
+
+        count_before = Ingredient.objects.count()
+        processed = 0
+        started = time.monotonic()
+        with open(path, 'r', encoding='utf-8') as file:
+            rows = READERS[file_format](file)
+            while True:
+                batch = [
+                    Ingredient(
                         name=name,
-                        measurement_unit=measurement_unit
+                        measurement_unit=measurement_unit,
+                        search_name=normalize_search_name(name),
                     )
-                except IntegrityError:
-                    print(f'Ингредиент {name} {measurement_unit}'
-                          f' есть в базе')
+                    for name, measurement_unit in islice(rows, batch_size)
+                ]
+                if not batch:
+                    break
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                processed += len(batch)
+        elapsed = time.monotonic() - started
+        bump_version(Ingredient)
+
+        created = Ingredient.objects.count() - count_before
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {processed}, добавлено: {created}, '
+            f'пропущено: {processed - created}. '
+            f'{processed / elapsed if elapsed else processed:.0f} строк/с.'
+        ))
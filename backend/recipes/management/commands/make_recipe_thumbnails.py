@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import make_thumbnail
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создаёт миниатюры для рецептов, у которых их ещё нет.'
+
+    def handle(self, *args, **options):
+        recipe_ids = list(Recipe.objects.filter(
+            image_thumb=''
+        ).values_list('id', flat=True))
+        for recipe_id in recipe_ids:
+            make_thumbnail(recipe_id)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано рецептов: {len(recipe_ids)}.'
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recipes import feed
+from recipes.models import FeedItem
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает ленты рецептов по подпискам пользователей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='Пересобрать ленту только указанного пользователя.',
+        )
+
+    def handle(self, *args, **options):
+        feed.rebuild(options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей в лентах: {FeedItem.objects.count()}.'
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recipes import shopping_list
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает сводные списки покупок по корзинам пользователей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='Пересобрать список только указанного пользователя.',
+        )
+
+    def handle(self, *args, **options):
+        shopping_list.rebuild(options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Позиций в списках покупок: {ShoppingListItem.objects.count()}.'
+        ))
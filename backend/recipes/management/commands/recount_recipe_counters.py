@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import FavoriteReceipe, Recipe, ShoppingCart
+
+
+def count_subquery(model):
+    """Подзапрос с количеством строк модели для рецепта."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(recipe=OuterRef('pk'))
+            .order_by()
+            .values('recipe')
+            .annotate(total=Count('pk'))
+            .values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики избранного и списков покупок у рецептов '
+        'одним запросом UPDATE.'
+    )
+
+    def handle(self, *args, **options):
+        updated = Recipe.objects.update(
+            favorites_count=count_subquery(FavoriteReceipe),
+            in_carts_count=count_subquery(ShoppingCart),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики пересчитаны у рецептов: {updated}.'
+        ))
@@ -0,0 +1,201 @@
+import random
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from PIL import Image
+
+from recipes import feed, matching, search, shopping_list
+from recipes.cache import bump_version
+from recipes.models import (FavoriteReceipe, Ingredient,
+                            IngredientInRecipesAmount, Recipe, ShoppingCart,
+                            Tag, normalize_search_name)
+from users.models import Follow, User
+
+USERNAME_PREFIX = 'bench_'
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+
+
+def placeholder_image():
+    """Одна картинка на все рецепты набора данных."""
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), '#E26C2D').save(buffer, 'PNG')
+    return default_storage.save(
+        'recipes/bench.png', ContentFile(buffer.getvalue())
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт синтетический набор данных для нагрузочного тестирования. '
+        'Все пользователи набора получают префикс bench_.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--follows-per-user', type=int, default=20)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--favorites-per-user', type=int, default=30)
+        parser.add_argument('--carts-per-user', type=int, default=10)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Удалить ранее созданный набор данных перед генерацией.',
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        if options['clear']:
+            User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+        with transaction.atomic():
+            tag_ids = self.ensure_tags()
+            ingredient_ids = self.ensure_ingredients()
+            user_ids = self.create_users(options['users'], batch_size)
+            self.create_relations(
+                Follow, 'author_id', user_ids, user_ids,
+                options['follows_per_user'], rng, batch_size,
+                exclude_self=True,
+            )
+            recipe_ids = self.create_recipes(
+                user_ids, options['recipes'], rng, batch_size
+            )
+            Recipe.tags.through.objects.bulk_create(
+                [
+                    Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                    for recipe_id in recipe_ids
+                    for tag_id in rng.sample(
+                        tag_ids, rng.randint(1, len(tag_ids))
+                    )
+                ],
+                batch_size=batch_size,
+            )
+            per_recipe = min(
+                options['ingredients_per_recipe'], len(ingredient_ids)
+            )
+            IngredientInRecipesAmount.objects.bulk_create(
+                [
+                    IngredientInRecipesAmount(
+                        recipe_id=recipe_id,
+                        ingredient_id=ingredient_id,
+                        amount=rng.randint(1, 500),
+                    )
+                    for recipe_id in recipe_ids
+                    for ingredient_id in rng.sample(
+                        ingredient_ids, per_recipe
+                    )
+                ],
+                batch_size=batch_size,
+            )
+            self.create_relations(
+                FavoriteReceipe, 'recipe_id', user_ids, recipe_ids,
+                options['favorites_per_user'], rng, batch_size,
+            )
+            self.create_relations(
+                ShoppingCart, 'recipe_id', user_ids, recipe_ids,
+                options['carts_per_user'], rng, batch_size,
+            )
+        call_command('recount_recipe_counters', verbosity=0)
+        shopping_list.rebuild(user_ids)
+        search.rebuild()
+        matching.invalidate()
+        feed.rebuild(user_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(user_ids)}, '
+            f'рецептов: {len(recipe_ids)}.'
+        ))
+
+    def ensure_tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in TAGS
+            )
+            bump_version(Tag)
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def ensure_ingredients(self):
+        if not Ingredient.objects.exists():
+            Ingredient.objects.bulk_create(
+                Ingredient(
+                    name=f'ингредиент {number}',
+                    measurement_unit='г',
+                    search_name=normalize_search_name(
+                        f'ингредиент {number}'
+                    ),
+                )
+                for number in range(500)
+            )
+            bump_version(Ingredient)
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def create_users(self, count, batch_size):
+        start = User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        ).count()
+        password = make_password('bench-password')
+        names = [
+            f'{USERNAME_PREFIX}{number}'
+            for number in range(start, start + count)
+        ]
+        User.objects.bulk_create(
+            [
+                User(
+                    username=name,
+                    email=f'{name}@example.com',
+                    first_name='Bench',
+                    last_name=name,
+                    password=password,
+                )
+                for name in names
+            ],
+            batch_size=batch_size,
+        )
+        return list(User.objects.filter(
+            username__in=names
+        ).values_list('id', flat=True))
+
+    def create_recipes(self, user_ids, count, rng, batch_size):
+        image = placeholder_image()
+        last_id = Recipe.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        Recipe.objects.bulk_create(
+            [
+                Recipe(
+                    author_id=rng.choice(user_ids),
+                    name=f'Рецепт {number}',
+                    text=f'Описание синтетического рецепта {number}',
+                    cooking_time=rng.randint(5, 180),
+                    image=image,
+                )
+                for number in range(count)
+            ],
+            batch_size=batch_size,
+        )
+        return list(Recipe.objects.filter(
+            id__gt=last_id, author_id__in=user_ids
+        ).values_list('id', flat=True))
+
+    def create_relations(self, model, field, user_ids, target_ids,
+                         per_user, rng, batch_size, exclude_self=False):
+        objects = []
+        for user_id in user_ids:
+            targets = rng.sample(target_ids, min(per_user, len(target_ids)))
+            objects.extend(
+                model(user_id=user_id, **{field: target_id})
+                for target_id in targets
+                if not (exclude_self and target_id == user_id)
+            )
+        model.objects.bulk_create(objects, batch_size=batch_size)
@@ -0,0 +1,147 @@
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from datetime import timedelta
+from itertools import chain
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import IngredientIndexChange, IngredientInRecipesAmount
+
+# Запас времени при чтении журнала: запись, сделанная транзакцией,
+# закоммиченной позже соседних, всё равно попадёт в окно.
+SYNC_OVERLAP = timedelta(minutes=1)
+
+_index = None
+
+
+class IngredientIndex:
+    """
+    Инвертированный индекс «ингредиент → отсортированный массив id
+    рецептов» и ингредиенты каждого рецепта. Изменения рецептов
+    применяются по журналу IngredientIndexChange без пересборки.
+    """
+
+    def __init__(self, rows, synced_at=None, applied=()):
+        recipes = defaultdict(lambda: array('I'))
+        ingredients = defaultdict(lambda: array('I'))
+        for ingredient_id, recipe_id in rows:
+            recipes[ingredient_id].append(recipe_id)
+            ingredients[recipe_id].append(ingredient_id)
+        self.recipes = dict(recipes)
+        self.ingredients = dict(ingredients)
+        self.synced_at = synced_at or timezone.now()
+        self.applied = set(applied)
+
+    @classmethod
+    def from_db(cls):
+        synced_at = timezone.now()
+        # Видимые сейчас записи журнала уже учтены в сборке.
+        applied = IngredientIndexChange.objects.filter(
+            created_at__gte=synced_at - SYNC_OVERLAP
+        ).values_list('id', flat=True)
+        return cls(
+            IngredientInRecipesAmount.objects.order_by(
+                'ingredient_id', 'recipe_id'
+            ).values_list('ingredient_id', 'recipe_id').iterator(),
+            synced_at, list(applied),
+        )
+
+    def update_recipe(self, recipe_id, ingredient_ids):
+        """
+        Заменяет ингредиенты рецепта: убирает его id из массивов старых
+        ингредиентов и вставляет в массивы новых с сохранением порядка.
+        Пустой список убирает рецепт из индекса.
+        """
+        for ingredient_id in self.ingredients.pop(recipe_id, ()):
+            recipe_ids = self.recipes[ingredient_id]
+            position = bisect_left(recipe_ids, recipe_id)
+            if (
+                position < len(recipe_ids)
+                and recipe_ids[position] == recipe_id
+            ):
+                del recipe_ids[position]
+        for ingredient_id in ingredient_ids:
+            insort(
+                self.recipes.setdefault(ingredient_id, array('I')),
+                recipe_id,
+            )
+        if ingredient_ids:
+            self.ingredients[recipe_id] = array('I', ingredient_ids)
+
+    def sync(self):
+        """
+        Применяет изменения из журнала, сделанные любым процессом.
+        Возвращает False, если индекс нужно пересобрать целиком.
+        """
+        now = timezone.now()
+        retention = timedelta(seconds=settings.MATCHING_CHANGES_RETENTION)
+        if now - self.synced_at > retention - SYNC_OVERLAP:
+            return False
+        changes = dict(IngredientIndexChange.objects.filter(
+            created_at__gte=self.synced_at - SYNC_OVERLAP
+        ).values_list('id', 'recipe_id'))
+        recipe_ids = {
+            recipe_id for change_id, recipe_id in changes.items()
+            if change_id not in self.applied
+        }
+        if None in recipe_ids:
+            return False
+        if recipe_ids:
+            ingredients = defaultdict(list)
+            for recipe_id, ingredient_id in (
+                IngredientInRecipesAmount.objects.filter(
+                    recipe_id__in=recipe_ids
+                ).values_list('recipe_id', 'ingredient_id')
+            ):
+                ingredients[recipe_id].append(ingredient_id)
+            for recipe_id in recipe_ids:
+                self.update_recipe(recipe_id, ingredients[recipe_id])
+        self.applied = set(changes)
+        self.synced_at = now
+        return True
+
+    def match(self, ingredient_ids, max_missing=None):
+        """
+        Рецепты, в которых есть хотя бы один из ингредиентов, в виде
+        (id рецепта, сколько ингредиентов есть, скольких не хватает).
+        Сначала рецепты, для которых не хватает меньше всего.
+        """
+        matched = Counter(chain.from_iterable(
+            self.recipes.get(ingredient_id, ())
+            for ingredient_id in set(ingredient_ids)
+        ))
+        result = []
+        for recipe_id, count in matched.items():
+            missing = len(self.ingredients[recipe_id]) - count
+            if max_missing is None or missing <= max_missing:
+                result.append((recipe_id, count, missing))
+        result.sort(key=lambda item: (item[2], -item[1], -item[0]))
+        return result
+
+
+def get_index():
+    """Индекс, догоняющий журнал изменений перед каждым подбором."""
+    global _index
+    if _index is None or not _index.sync():
+        _index = IngredientIndex.from_db()
+    return _index
+
+
+def record_change(recipe_id):
+    """
+    Ингредиенты рецепта изменились. Запись журнала попадает в базу вместе
+    с транзакцией изменения; устаревшие записи удаляются.
+    """
+    IngredientIndexChange.objects.create(recipe_id=recipe_id)
+    IngredientIndexChange.objects.filter(
+        created_at__lt=timezone.now() - timedelta(
+            seconds=settings.MATCHING_CHANGES_RETENTION
+        )
+    ).delete()
+
+
+def invalidate():
+    """Ингредиенты изменились массово: индекс пересоберётся целиком."""
+    IngredientIndexChange.objects.create(recipe_id=None)
@@ -0,0 +1,66 @@
+# Generated by Django 3.2 on 2026-10-18 12:30
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+# Предел PositiveSmallIntegerField для суммы количеств.
+MAX_AMOUNT = 32767
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """
+    Сливает ингредиенты с одинаковыми названием и единицей измерения
+    в запись с наименьшим id, иначе ограничение не создастся.
+    Ингредиенты рецептов переводятся на оставшуюся запись; если в рецепте
+    были оба дубля, количества складываются.
+    """
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientInRecipesAmount = apps.get_model(
+        'recipes', 'IngredientInRecipesAmount'
+    )
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        keep_id=Min('id'), count=Count('id')
+    ).filter(count__gt=1).order_by()
+    for duplicate in duplicates:
+        keep_id = duplicate['keep_id']
+        merged_ids = list(Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit'],
+        ).exclude(id=keep_id).values_list('id', flat=True))
+        kept = {}
+        for amount in IngredientInRecipesAmount.objects.filter(
+            ingredient_id__in=[keep_id, *merged_ids]
+        ).order_by('recipe_id', 'ingredient_id'):
+            row = kept.get(amount.recipe_id)
+            if row is None:
+                kept[amount.recipe_id] = amount
+                continue
+            row.amount = min(row.amount + amount.amount, MAX_AMOUNT)
+            amount.delete()
+        for row in kept.values():
+            row.ingredient_id = keep_id
+            row.save(update_fields=['ingredient', 'amount'])
+        Ingredient.objects.filter(id__in=merged_ids).delete()
+    if duplicates and schema_editor.connection.vendor == 'postgresql':
+        # Отложенные проверки внешних ключей выполняются сейчас:
+        # с ними в очереди PostgreSQL не даст изменить таблицу.
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_ingredient_search_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_unit'),
+        ),
+    ]
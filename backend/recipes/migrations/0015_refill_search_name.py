@@ -0,0 +1,30 @@
+# Generated by Django 3.2 on 2026-10-18 23:00
+
+from django.db import migrations
+
+from recipes.models import normalize_search_name
+
+
+def refill_search_name(apps, schema_editor):
+    """Пересчёт названий для поиска: «й» больше не превращается в «и»."""
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    changed = []
+    for ingredient in Ingredient.objects.only('id', 'name', 'search_name'):
+        search_name = normalize_search_name(ingredient.name)
+        if ingredient.search_name != search_name:
+            ingredient.search_name = search_name
+            changed.append(ingredient)
+    Ingredient.objects.bulk_update(
+        changed, ['search_name'], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_ingredientindexchange'),
+    ]
+
+    operations = [
+        migrations.RunPython(refill_search_name, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.2 on 2026-10-18 22:10
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def mark_fanned_out(apps, schema_editor):
+    """
+    Рецепты авторов ниже порога считаются разложенными; недостающие
+    записи лент (подписки, оформленные после публикации) дописываются.
+    Рецепты остальных авторов подмешиваются в ленты при чтении.
+    """
+    Follow = apps.get_model('users', 'Follow')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedItem = apps.get_model('recipes', 'FeedItem')
+    pull_authors = list(Follow.objects.values('author_id').annotate(
+        followers=Count('id')
+    ).filter(
+        followers__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values_list('author_id', flat=True))
+    Recipe.objects.exclude(author_id__in=pull_authors).update(fanned_out=True)
+    recipes = Recipe.objects.filter(
+        fanned_out=True, author__following__isnull=False
+    ).values_list('author__following__user_id', 'id', 'pub_date')
+    FeedItem.objects.bulk_create(
+        (
+            FeedItem(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for user_id, recipe_id, pub_date in recipes.iterator()
+        ),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('recipes', '0015_refill_search_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='fanned_out',
+            field=models.BooleanField(default=False, editable=False, help_text='Рецепт скопирован в ленты подписчиков при публикации; иначе он подмешивается в ленты при чтении', verbose_name='Разложен по лентам'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(fanned_out=False), fields=['author', '-pub_date', '-id'], name='recipe_pulled_feed_idx'),
+        ),
+        migrations.RunPython(mark_fanned_out, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,31 @@
+import unicodedata
+
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
 from users.models import User
 
 
+# Кратка в «й» — часть буквы, а не диакритика: «йогурт» не «иогурт».
+BREVE = '\u0306'
+
+
+def normalize_search_name(value):
+    """
+    Приводит строку к виду для поиска: без учёта регистра и диакритики,
+    так что «Свёкла» и «свекла», «Crème» и «creme» совпадают,
+    а «й» остаётся отдельной буквой.
+    """
+    decomposed = unicodedata.normalize('NFKD', value.casefold())
+    kept = []
+    for char in decomposed:
+        if not unicodedata.combining(char):
+            kept.append(char)
+        elif char == BREVE and kept and kept[-1] == 'и':
+            kept.append(char)
+    return unicodedata.normalize('NFC', ''.join(kept))
+
+
 class Tag(models.Model):
     """Модель для тегов."""
 
@@ -45,14 +68,47 @@ class Ingredient(models.Model):
         help_text='Единица измерения количества ингредиента',
         max_length=200,
     )
+    search_name = models.CharField(
+        verbose_name='Название для поиска',
+        help_text='Название без учёта регистра и диакритики',
+        max_length=200,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        indexes = [
+            models.Index(
+                fields=['search_name'],
+                name='ingredient_search_name_idx',
+                opclasses=['varchar_pattern_ops'],
+            )
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_unit',
+            )
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
 
+    def save(self, *args, **kwargs):
+        self.search_name = normalize_search_name(self.name)
+        super().save(*args, **kwargs)
+
+
+class RecipeManager(models.Manager):
+    """
+    Рецепты без поискового вектора: он нужен только условиям поиска
+    в базе и не должен читаться вместе с каждым рецептом.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().defer('search_vector')
+
 
 class Recipe(models.Model):
     """Модель для рецептов."""
@@ -83,6 +139,12 @@ class Recipe(models.Model):
         'Фотография блюда',
         upload_to='recipes/',
     )
+    image_thumb = models.ImageField(
+        'Миниатюра фотографии',
+        upload_to='recipes/thumbs/',
+        blank=True,
+        editable=False,
+    )
     text = models.TextField(
         'Описание рецепта'
     )
@@ -91,11 +153,54 @@ class Recipe(models.Model):
         help_text='Время приготовления блюда',
     )
     pub_date = models.DateTimeField(auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        help_text='Сколько пользователей добавили рецепт в избранное',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='В списках покупок',
+        help_text='Сколько пользователей добавили рецепт в список покупок',
+        default=0,
+        editable=False,
+    )
+    fanned_out = models.BooleanField(
+        verbose_name='Разложен по лентам',
+        help_text='Рецепт скопирован в ленты подписчиков при публикации; '
+                  'иначе он подмешивается в ленты при чтении',
+        default=False,
+        editable=False,
+    )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        help_text='Название, ингредиенты и описание для полнотекстового '
+                  'поиска (PostgreSQL)',
+        null=True,
+        editable=False,
+    )
+
+    objects = RecipeManager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_pulled_feed_idx',
+                condition=models.Q(fanned_out=False),
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -162,6 +267,12 @@ class FavoriteReceipe(models.Model):
                 name='favorite_recipe',
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'],
+                name='favorite_recipe_user_idx',
+            )
+        ]
 
 
 class ShoppingCart(models.Model):
@@ -190,3 +301,154 @@ class ShoppingCart(models.Model):
                 name='recipe_in_shopping_cart',
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'],
+                name='cart_recipe_user_idx',
+            )
+        ]
+
+
+class ShoppingListItem(models.Model):
+    """
+    Сводный список покупок пользователя: суммарное количество каждого
+    ингредиента по всем рецептам из списка покупок.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+        help_text='Суммарное количество ингредиента по рецептам',
+    )
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Сводные списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item',
+            )
+        ]
+
+
+class FeedItem(models.Model):
+    """
+    Рецепт в ленте подписчика автора. Заполняется при публикации рецепта
+    и при подписке; дата публикации продублирована для сортировки ленты
+    по индексу.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Рецепт',
+    )
+    pub_date = models.DateTimeField('Дата публикации рецепта')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_item',
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_item_user_pub_date_idx',
+            ),
+        ]
+
+
+class RecipeSimilarity(models.Model):
+    """
+    Похожий рецепт: косинусная близость по добавлениям в избранное.
+    Для каждого рецепта хранится top-K соседей, таблицу пересчитывает
+    команда build_recommendations.
+    """
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField('Близость')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_recipe_similarity',
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'],
+                name='recipe_similarity_score_idx',
+            ),
+        ]
+
+
+class DataVersion(models.Model):
+    """
+    Версия данных модели для кэшей всех процессов: номер растёт при
+    каждом изменении, время изменения отдаётся в Last-Modified.
+    """
+
+    label = models.CharField('Модель', max_length=100, primary_key=True)
+    version = models.PositiveIntegerField('Версия', default=0)
+    updated_at = models.DateTimeField('Время изменения')
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.label}: {self.version}'
+
+
+class IngredientIndexChange(models.Model):
+    """
+    Рецепт, ингредиенты которого изменились: по этому журналу процессы
+    обновляют индекс подбора рецептов в памяти. Пустой рецепт означает
+    полную пересборку индекса.
+    """
+
+    recipe_id = models.PositiveIntegerField('Рецепт', null=True)
+    created_at = models.DateTimeField(
+        'Время изменения', auto_now_add=True, db_index=True
+    )
+
+    class Meta:
+        verbose_name = 'Изменение индекса ингредиентов'
+        verbose_name_plural = 'Журнал индекса ингредиентов'
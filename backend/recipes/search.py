@@ -0,0 +1,160 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery
+
+from .cache import bump_version, get_version
+from .models import IngredientInRecipesAmount, Recipe, normalize_search_name
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Веса полей как у ts_rank по умолчанию для A, B и C.
+WEIGHTS = {'name': 1.0, 'ingredients': 0.4, 'text': 0.2}
+
+_index = None
+
+
+def search_vector():
+    """Взвешенный вектор: название (A), ингредиенты (B), описание (C)."""
+    config = settings.SEARCH_CONFIG
+    ingredients = IngredientInRecipesAmount.objects.filter(
+        recipe=OuterRef('pk')
+    ).values('recipe').annotate(
+        names=StringAgg('ingredient__name', ' ')
+    ).values('names')
+    return (
+        SearchVector('name', weight='A', config=config)
+        + SearchVector(Subquery(ingredients), weight='B', config=config)
+        + SearchVector('text', weight='C', config=config)
+    )
+
+
+def update_recipes(recipe_ids):
+    """Обновляет поисковые данные рецептов после изменения."""
+    if connection.vendor == 'postgresql':
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            search_vector=search_vector()
+        )
+    else:
+        transaction.on_commit(lambda: bump_version(Recipe))
+
+
+def rebuild(batch_size=1000):
+    """Пересчитывает поисковые данные всех рецептов."""
+    if connection.vendor != 'postgresql':
+        bump_version(Recipe)
+        return
+    recipe_ids = list(Recipe.objects.values_list('pk', flat=True))
+    for start in range(0, len(recipe_ids), batch_size):
+        update_recipes(recipe_ids[start:start + batch_size])
+
+
+def tokenize(value):
+    return [normalize_search_name(token) for token in TOKEN_RE.findall(value)]
+
+
+class InvertedIndex:
+    """
+    Инвертированный индекс «слово → {id рецепта: вес}» в памяти процесса
+    для баз без полнотекстового поиска. Слово запроса совпадает со всеми
+    словами, которые с него начинаются.
+    """
+
+    def __init__(self, documents):
+        postings = defaultdict(lambda: defaultdict(float))
+        for recipe_id, fields in documents:
+            for field, value in fields.items():
+                for token in set(tokenize(value)):
+                    postings[token][recipe_id] += WEIGHTS[field]
+        self.postings = dict(postings)
+        self.terms = sorted(self.postings)
+
+    @classmethod
+    def from_db(cls):
+        ingredients = defaultdict(list)
+        for recipe_id, name in IngredientInRecipesAmount.objects.values_list(
+            'recipe_id', 'ingredient__name'
+        ).iterator():
+            ingredients[recipe_id].append(name)
+        return cls(
+            (pk, {
+                'name': name,
+                'ingredients': ' '.join(ingredients[pk]),
+                'text': text,
+            })
+            for pk, name, text in Recipe.objects.values_list(
+                'pk', 'name', 'text'
+            ).iterator()
+        )
+
+    def search(self, query):
+        """Рецепты, содержащие все слова запроса, с их весами."""
+        scores = None
+        for token in set(tokenize(query)):
+            matches = defaultdict(float)
+            position = bisect_left(self.terms, token)
+            while (
+                position < len(self.terms)
+                and self.terms[position].startswith(token)
+            ):
+                for recipe_id, weight in self.postings[
+                    self.terms[position]
+                ].items():
+                    matches[recipe_id] = max(matches[recipe_id], weight)
+                position += 1
+            if scores is None:
+                scores = matches
+            else:
+                scores = {
+                    recipe_id: score + matches[recipe_id]
+                    for recipe_id, score in scores.items()
+                    if recipe_id in matches
+                }
+            if not scores:
+                break
+        return scores or {}
+
+
+def get_index():
+    """Индекс текущей версии рецептов, пересобираемый после изменений."""
+    global _index
+    version = get_version(Recipe)
+    if _index is None or _index[0] != version:
+        _index = (version, InvertedIndex.from_db())
+    return _index[1]
+
+
+def uses_database_ranking():
+    """Ищет и ранжирует ли рецепты сама база (PostgreSQL)."""
+    return connection.vendor == 'postgresql'
+
+
+def search_recipes(queryset, query):
+    """
+    Оставляет рецепты, подходящие под запрос, и сортирует их по
+    релевантности (search_rank), затем по дате публикации.
+    Только для PostgreSQL, для остальных баз — rank_recipes.
+    """
+    search_query = SearchQuery(
+        query, config=settings.SEARCH_CONFIG, search_type='websearch'
+    )
+    return queryset.filter(search_vector=search_query).annotate(
+        search_rank=SearchRank(F('search_vector'), search_query)
+    ).order_by('-search_rank', '-pub_date', '-id')
+
+
+def rank_recipes(recipe_ids, query):
+    """
+    Id рецептов из recipe_ids, подходящих под запрос, по убыванию веса
+    в индексе в памяти. При равном весе сохраняется порядок recipe_ids.
+    """
+    scores = get_index().search(query)
+    ranked = [recipe_id for recipe_id in recipe_ids if recipe_id in scores]
+    ranked.sort(key=lambda recipe_id: -scores[recipe_id])
+    return ranked
@@ -0,0 +1,113 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from users.models import User
+
+from .models import IngredientInRecipesAmount, ShoppingCart, ShoppingListItem
+
+
+def recipe_amounts(recipe_id):
+    """Количество каждого ингредиента в рецепте."""
+    return dict(IngredientInRecipesAmount.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('ingredient_id', 'amount'))
+
+
+def cart_user_ids(recipe_id):
+    """Пользователи, у которых рецепт лежит в списке покупок."""
+    return list(ShoppingCart.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('user_id', flat=True))
+
+
+@transaction.atomic
+def apply_delta(user_ids, delta):
+    """
+    Прибавляет изменения количества ингредиентов к сводным спискам
+    покупок пользователей. Позиции с нулевым количеством удаляются.
+    """
+    delta = {
+        ingredient_id: amount for ingredient_id, amount in delta.items()
+        if amount
+    }
+    if not user_ids or not delta:
+        return
+    list(User.objects.select_for_update().filter(
+        pk__in=user_ids
+    ).order_by('pk').values_list('pk'))
+    items = ShoppingListItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=delta
+    )
+    existing = set(items.values_list('user_id', 'ingredient_id'))
+    if existing:
+        items.update(total_amount=Greatest(
+            F('total_amount') + Case(
+                *(
+                    When(ingredient_id=ingredient_id, then=Value(amount))
+                    for ingredient_id, amount in delta.items()
+                ),
+                output_field=IntegerField(),
+            ),
+            0,
+        ))
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(
+            user_id=user_id, ingredient_id=ingredient_id, total_amount=amount
+        )
+        for user_id in user_ids
+        for ingredient_id, amount in delta.items()
+        if amount > 0 and (user_id, ingredient_id) not in existing
+    )
+    items.filter(total_amount=0).delete()
+
+
+def add_recipe(user_id, recipe_id):
+    """Рецепт добавлен в список покупок пользователя."""
+    apply_delta([user_id], recipe_amounts(recipe_id))
+
+
+def remove_recipe(user_id, recipe_id):
+    """Рецепт убран из списка покупок пользователя."""
+    apply_delta([user_id], {
+        ingredient_id: -amount
+        for ingredient_id, amount in recipe_amounts(recipe_id).items()
+    })
+
+
+def change_recipe(recipe_id, delta):
+    """Ингредиенты рецепта изменились у всех, у кого он в списке покупок."""
+    apply_delta(cart_user_ids(recipe_id), delta)
+
+
+def delete_recipe(recipe_id):
+    """Рецепт удаляется: убирает его из всех сводных списков покупок."""
+    apply_delta(cart_user_ids(recipe_id), {
+        ingredient_id: -amount
+        for ingredient_id, amount in recipe_amounts(recipe_id).items()
+    })
+
+
+@transaction.atomic
+def rebuild(user_ids=None, batch_size=1000):
+    """Пересобирает сводные списки покупок по корзинам пользователей."""
+    items = ShoppingListItem.objects.all()
+    cart_filter = {'recipe__shopping_recipes__isnull': False}
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+        cart_filter = {'recipe__shopping_recipes__user_id__in': user_ids}
+    items.delete()
+    amounts = IngredientInRecipesAmount.objects.filter(**cart_filter).values(
+        'recipe__shopping_recipes__user_id', 'ingredient_id'
+    ).annotate(total_amount=Sum('amount')).order_by()
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(
+                user_id=row['recipe__shopping_recipes__user_id'],
+                ingredient_id=row['ingredient_id'],
+                total_amount=row['total_amount'],
+            )
+            for row in amounts.iterator()
+        ),
+        batch_size=batch_size,
+    )
@@ -0,0 +1,116 @@
+from threading import local
+
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import matching, search, shopping_list
+from .cache import bump_version
+from .models import (Ingredient, IngredientInRecipesAmount, Recipe,
+                     ShoppingCart, Tag)
+
+# Рецепты, удаление которых сейчас идёт в этом потоке: их корзины и
+# ингредиенты удаляются каскадом и уже учтены в сводных списках.
+_deleting = local()
+
+
+def deleting_recipes():
+    if not hasattr(_deleting, 'recipe_ids'):
+        _deleting.recipe_ids = set()
+    return _deleting.recipe_ids
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_reference_cache(sender, **kwargs):
+    """Сбрасывает кэш справочников тегов и ингредиентов при изменениях."""
+    bump_version(sender)
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes(sender, instance, created, **kwargs):
+    """Переименование ингредиента меняет поисковые данные рецептов."""
+    if not created:
+        search.update_recipes(IngredientInRecipesAmount.objects.filter(
+            ingredient=instance
+        ).values('recipe_id'))
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_deleted_recipe(sender, instance, **kwargs):
+    """
+    Удаляемый рецепт убирается из сводных списков покупок целиком, пока
+    его ингредиенты и корзины ещё в базе (в том числе при удалении из
+    админки и каскадом вместе с автором).
+    """
+    deleting_recipes().add(instance.pk)
+    shopping_list.delete_recipe(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_deleted_recipe(sender, instance, **kwargs):
+    """Удалённый рецепт убирается из индексов подбора всех процессов."""
+    deleting_recipes().discard(instance.pk)
+    matching.record_change(instance.pk)
+
+
+@receiver(pre_save, sender=ShoppingCart)
+@receiver(pre_save, sender=IngredientInRecipesAmount)
+def remember_saved_row(sender, instance, raw, **kwargs):
+    """Запоминает сохранённое в базе состояние изменяемой записи."""
+    instance.saved_row = None
+    if instance.pk is not None and not raw:
+        instance.saved_row = sender.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=ShoppingCart)
+def save_cart_recipe(sender, instance, raw, **kwargs):
+    """Рецепт добавлен в список покупок (или запись изменена в админке)."""
+    if raw:
+        return
+    saved = getattr(instance, 'saved_row', None)
+    if saved is not None:
+        if (saved.user_id, saved.recipe_id) == (
+            instance.user_id, instance.recipe_id
+        ):
+            return
+        shopping_list.remove_recipe(saved.user_id, saved.recipe_id)
+    shopping_list.add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def delete_cart_recipe(sender, instance, **kwargs):
+    """Рецепт убран из списка покупок."""
+    if instance.recipe_id not in deleting_recipes():
+        shopping_list.remove_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_save, sender=IngredientInRecipesAmount)
+def save_recipe_amount(sender, instance, raw, **kwargs):
+    """
+    Ингредиент рецепта добавлен или изменён поштучно (инлайн в админке).
+    Массовые изменения из API учитывает RecipesWriteSerializer.
+    """
+    if raw:
+        return
+    delta = {instance.ingredient_id: instance.amount}
+    saved = getattr(instance, 'saved_row', None)
+    if saved is not None:
+        delta[saved.ingredient_id] = (
+            delta.get(saved.ingredient_id, 0) - saved.amount
+        )
+    shopping_list.change_recipe(instance.recipe_id, delta)
+    if saved is None or saved.ingredient_id != instance.ingredient_id:
+        matching.record_change(instance.recipe_id)
+
+
+@receiver(post_delete, sender=IngredientInRecipesAmount)
+def delete_recipe_amount(sender, instance, **kwargs):
+    """Ингредиент убран из рецепта."""
+    if instance.recipe_id not in deleting_recipes():
+        shopping_list.change_recipe(
+            instance.recipe_id, {instance.ingredient_id: -instance.amount}
+        )
+        matching.record_change(instance.recipe_id)
@@ -0,0 +1,35 @@
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файловое хранилище с именами по хэшу содержимого.
+    Одинаковые файлы получают одно имя и записываются на диск один раз,
+    даже если фотографию рецепта загружают заново при каждом сохранении.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            return super().save(name, content, max_length)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        dirname, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        name = os.path.join(dirname, digest[:2], digest + extension)
+        if self.exists(name):
+            try:
+                # Свежее время изменения не даст collect_media_garbage
+                # удалить файл, который снова стал нужен.
+                os.utime(self.path(name))
+                return name.replace('\\', '/')
+            except FileNotFoundError:
+                pass
+        return super().save(name, content, max_length)
@@ -0,0 +1,37 @@
+from django.db.models import Case, CharField, F, IntegerField, Value, When
+
+# Единица измерения → (каноническая единица, множитель перевода в неё).
+UNIT_CONVERSIONS = {
+    'г': ('г', 1),
+    'кг': ('г', 1000),
+    'мл': ('мл', 1),
+    'л': ('мл', 1000),
+    'ч. л.': ('ч. л.', 1),
+    'ст. л.': ('ч. л.', 3),
+}
+
+
+def canonical_unit(field):
+    """Выражение: каноническая единица для единицы из поля field."""
+    return Case(
+        *(
+            When(**{field: unit}, then=Value(canonical))
+            for unit, (canonical, _) in UNIT_CONVERSIONS.items()
+            if unit != canonical
+        ),
+        default=F(field),
+        output_field=CharField(),
+    )
+
+
+def unit_factor(field):
+    """Выражение: множитель перевода в каноническую единицу."""
+    return Case(
+        *(
+            When(**{field: unit}, then=Value(factor))
+            for unit, (_, factor) in UNIT_CONVERSIONS.items()
+            if factor != 1
+        ),
+        default=Value(1),
+        output_field=IntegerField(),
+    )